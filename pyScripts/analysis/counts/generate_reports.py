@@ -0,0 +1,53 @@
+''' Script that loads the storage and MongoDB counts once and renders any of the general,
+    detailed and unique StudyInstanceUID count reports, each in any of the formats .md, .csv
+    and .html.
+
+    Sample run:
+        python3 generate_reports.py -s dicom_count.json -m mongoCounts.json -u uniqueStudies.json -f md html
+
+    For help:
+        python3 generate_reports.py -h
+'''
+
+import argparse
+from datetime import datetime
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # pyScripts/modules
+from modules import cube_lib, report_lib
+
+NOW = datetime.now()
+TIMESTAMP = ("{0}-{1}-{2}_{3}:{4}:{5}").format(NOW.year, NOW.month, NOW.day, NOW.hour, NOW.minute, NOW.second)
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--storage", "-s", help = "Path to the storage counts file", type = str, required = True)
+parser.add_argument("--mongo", "-m", help = "Path to the mongo counts file, for the general and detailed reports", type = str, required = False)
+parser.add_argument("--unique", "-u", help = "Path to the unique StudyInstanceUID Mongo counts file, for the unique report", type = str, required = False)
+parser.add_argument("--general", "-g", help = "Path (extension replaced per format) of the general report. Default to reports/countGeneralReport-<time>", type = str, required = False)
+parser.add_argument("--detailed", "-d", help = "Path (extension replaced per format) of the detailed report. Default to reports/countDetailedReport-<time>", type = str, required = False)
+parser.add_argument("--unique-report", "-U", help = "Path (extension replaced per format) of the unique report. Default to reports/countUniqueStudiesReport-<time>", type = str, required = False)
+parser.add_argument("--formats", "-f", help = "Report formats. Default to md", nargs = "+", choices = report_lib.FORMATS, default = ["md"])
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.mongo is None and args.unique is None:
+        parser.error("at least one of --mongo or --unique is required")
+
+    # Every count file is streamed once, into one cube shared by all reports
+    CUBE = cube_lib.load_cube_files(storage=args.storage, mongo=args.mongo, unique=args.unique)
+
+    REPORTS = []
+
+    if args.mongo is not None:
+        REPORTS.append(("general", args.general or "reports/countGeneralReport-" + TIMESTAMP))
+        REPORTS.append(("detailed", args.detailed or "reports/countDetailedReport-" + TIMESTAMP))
+
+    if args.unique is not None:
+        REPORTS.append(("unique", args.unique_report or "reports/countUniqueStudiesReport-" + TIMESTAMP))
+
+    for name, stem in REPORTS:
+        report = report_lib.REPORTS[name](CUBE, NOW)
+
+        for path in report.write_all(stem, args.formats):
+            print(f"Successfully written {path}")
@@ -3,7 +3,8 @@
    1. MongoDB pre-deduplication accounting
    2. Pre-deduplication general and detailed reporting
    3. De-duplicating
-   4. MongoDB post-deduplication accounting
+   4. MongoDB post-deduplication accounting, recounting only the days
+      touched by deduplication on top of the pre-deduplication counts
    5. Post-deduplication general and detailed reporting
 
    The filepaths for these outputs are:
@@ -11,6 +12,8 @@
    2. -> reports/reportsBeforeDedup
    4. -> counts/countsAfterDedup
    5. -> reports/reportsAfterDedup
+   The days touched by deduplication -> counts/countsAfterDedup/touchedDays
+   Both count runs are also saved to the snapshot store counts/snapshots.
 
    This script is to be a cronjob for regular runs ensuring
    the storage counts have enough time to perform beforehand.
@@ -26,6 +29,7 @@ cd /nfs/smi/home/smi/MongoDbQueries/counts/
 
 timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
 LOG="logs/${timestamp}.log"
+run="${timestamp}"
 bcounts="counts/countsBeforeDedup/mongoCounts-${timestamp}.json"
 bgreport="reports/reportsBeforeDedup/countGeneralReport-${timestamp}.md"
 bdreport="reports/reportsBeforeDedup/countDetailedReport-${timestamp}.md"
@@ -33,33 +37,50 @@ bdreport="reports/reportsBeforeDedup/countDetailedReport-${timestamp}.md"
 acounts="counts/countsAfterDedup/mongoCounts-${timestamp}.json"
 agreport="reports/reportsAfterDedup/countGeneralReport-${timestamp}.md"
 adreport="reports/reportsAfterDedup/countDetailedReport-${timestamp}.md"
+touched="counts/countsAfterDedup/touchedDays-${timestamp}.json"
 
 function count() {
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
     echo "Daily count start: ${timestamp}" >> $LOG
-    mongo --quiet --eval "var maxYear = 2018;" queries/countByDay.js > $1
+    python3 queries/mongo_counts_by_day.py -max 2018 -f $1 "${@:2}"
+    status=$?
 
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
-    echo "Daily count end: ${timestamp}" >> $LOGppopp
+    echo "Daily count end: ${timestamp}" >> $LOG
+    return $status
+}
+
+function snapshot() {
+    timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
+    echo "Snapshot start: ${timestamp}" >> $LOG
+    python3 snapshot_counts.py -d counts/snapshots save -s "/beegfs-hdruk/smi/data/counts/dicom_count.json" -m $1 -r $2 -l $3
+    status=$?
+
+    timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
+    echo "Snapshot end: ${timestamp}" >> $LOG
+    return $status
 }
 
 function report() {
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
     echo "Report start: ${timestamp}" >> $LOG
-    python3 generate_report.py -s "/beegfs-hdruk/smi/data/counts/dicom_count.json" -m $3 -r $1
-    python3 generate_detailed_report.py -s "/beegfs-hdruk/smi/data/counts/dicom_count.json" -m $3 -r $2
+    python3 generate_reports.py -s "/beegfs-hdruk/smi/data/counts/dicom_count.json" -m $3 -g $1 -d $2
+    status=$?
 
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
     echo "Report end timestamp: ${timestamp}" >> $LOG
+    return $status
 }
 
 function deduplicate() {
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
     echo "Deduplication start: ${timestamp}" >> $LOG
-    mongo ../deduplication/deleteRepeatedByFilePath.js > ../deduplication/logs/${timestamp}.log
+    python3 queries/mongo_dedup.py -m ../deduplication/manifests/ -t $touched > ../deduplication/logs/${timestamp}.log
+    status=$?
 
     timestamp=`date "+%Y-%m-%d_%H:%M:%S"`
     echo "Deduplicsation finish: ${timestamp}" >> $LOG
+    return $status
 }
 
-count $bcounts && report $bgreport $bdreport $bcounts && deduplicate && count $acounts && report $agreport $adreport $acounts
\ No newline at end of file
+count $bcounts && snapshot $bcounts "${run}_before" before-dedup && report $bgreport $bdreport $bcounts && deduplicate && count $acounts -b $bcounts -t $touched && snapshot $acounts "${run}_after" after-dedup && report $agreport $adreport $acounts
\ No newline at end of file
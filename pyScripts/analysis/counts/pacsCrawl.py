@@ -0,0 +1,39 @@
+''' Stand-alone script crawling the PACS year/month/day/accession tree once and writing
+    any of: per-day file counts, per-day accession lists, per-accession file counts and sizes.
+'''
+import argparse  # Terminal arguments and help utility
+import os  # Resolving the modules path
+import sys
+import json  # Writing output files
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # pyScripts/modules
+from modules import crawl_lib  # Crawling the PACS tree in parallel
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--minyear", "-min", help = "Minimum for range of years to be checked. Default to 2010.", type = int, default = 2010)
+parser.add_argument("--maxyear", "-max", help = "Maximum (exclusive) for range of years to be checked. Default to 2019.", type = int, default = 2019)
+parser.add_argument("--counts", "-n", help = "Output path of the per-day file counts (as pacsCountsByDay.py).", type = str)
+parser.add_argument("--studies", "-s", help = "Output path of the per-day accession lists (as pacsListAccessionPaths.py).", type = str)
+parser.add_argument("--sizes", "-z", help = "Output path of the per-accession file counts and byte totals.", type = str)
+parser.add_argument("--workers", "-w", help = "Number of crawling processes. Default to 12.", type = int, default = 12)
+parser.add_argument("--granularity", "-g", help = "Work unit: day or accession directory. Default to day.", type = str, default = "day", choices = ["day", "accession"])
+parser.add_argument("--manifest", "-m", help = "Manifest file caching day directory listings between runs. Default to no cache.", type = str)
+parser.add_argument("--full", "-f", help = "Re-list every day directory, refreshing the manifest.", action = "store_true")
+parser.add_argument("--check", "-c", help = "Number of random cached days to re-list as a check. Default to 0.", type = int, default = 0)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    outputs = [(name, getattr(args, name)) for name in crawl_lib.COLLECTORS if getattr(args, name) is not None]
+
+    if not outputs:
+        parser.error("at least one of --counts, --studies or --sizes is required")
+
+    manifest = None if args.manifest is None else crawl_lib.DirManifest(args.manifest)
+    trees = crawl_lib.crawl(range(args.minyear, args.maxyear), [crawl_lib.COLLECTORS[name]() for name, _ in outputs],
+                            args.workers, args.granularity, manifest=manifest, full=args.full, check=args.check)
+
+    for (name, path), tree in zip(outputs, trees):
+        with open(path, "w") as outputfile:
+            json.dump(tree, outputfile, indent=4)  # Make human-readable with indent=4
+
+        crawl_lib.print_timestamped("Written " + name + " to " + path + ".")
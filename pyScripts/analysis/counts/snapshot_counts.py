@@ -0,0 +1,82 @@
+''' Script that saves count runs into a snapshot store and queries them over time.
+
+    Sample runs:
+        python3 snapshot_counts.py save -s dicom_count.json -m mongoCounts.json -l before-dedup
+        python3 snapshot_counts.py list
+        python3 snapshot_counts.py delta -a <old run> -b <new run> -t path
+        python3 snapshot_counts.py trend -c image_CT -t study -p month
+
+    For help:
+        python3 snapshot_counts.py -h
+'''
+
+import csv
+import sys
+import argparse
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # pyScripts/modules
+from modules import cube_lib, snapshot_lib
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--store", "-d", help = "Snapshot store directory. Default to counts/snapshots", type = str, default = "counts/snapshots")
+actions = parser.add_subparsers(dest = "action", required = True)
+
+save_parser = actions.add_parser("save", help = "Save the count files of a run as a new snapshot")
+save_parser.add_argument("--storage", "-s", help = "Path to the storage counts file", type = str)
+save_parser.add_argument("--mongo", "-m", help = "Path to the mongo counts file", type = str)
+save_parser.add_argument("--unique", "-u", help = "Path to the unique StudyInstanceUID Mongo counts file", type = str)
+save_parser.add_argument("--run", "-r", help = "Run name. Default to the current time", type = str)
+save_parser.add_argument("--label", "-l", help = "Run label, e.g. before-dedup or after-dedup", type = str)
+
+actions.add_parser("list", help = "List the saved runs")
+
+for name, help_text in [("delta", "Per-day delta between two runs"), ("trend", "Totals per period of every run")]:
+    query_parser = actions.add_parser(name, help = help_text)
+    query_parser.add_argument("--metric", "-t", help = "One of " + ", ".join(cube_lib.METRICS) + ". Default to path", type = str, default = "path", choices = cube_lib.METRICS)
+    query_parser.add_argument("--collection", "-c", help = "Collection(s) to sum over. Default to every Mongo collection", type = str, nargs = "+")
+    query_parser.add_argument("--start", help = "First day (YYYY-MM-DD) of the query", type = str)
+    query_parser.add_argument("--end", help = "Day (YYYY-MM-DD) after the last of the query", type = str)
+    query_parser.add_argument("--output", "-o", help = "Output CSV path. Default to stdout", type = str)
+
+    if name == "delta":
+        query_parser.add_argument("--old", "-a", help = "Older run", type = str, required = True)
+        query_parser.add_argument("--new", "-b", help = "Newer run", type = str, required = True)
+        query_parser.add_argument("--changed", help = "Only write days whose count changed", action = "store_true")
+    else:
+        query_parser.add_argument("--period", "-p", help = "Period of the totals. Default to year", type = str, default = "year", choices = list(cube_lib.PERIODS))
+        query_parser.add_argument("--label", "-l", help = "Only runs of this label", type = str)
+
+def write_rows(path, rows):
+    '''Writes CSV rows to a file, or to stdout without a path.'''
+    if path is None:
+        csv.writer(sys.stdout, lineterminator = "\n").writerows(rows)
+        return
+
+    with open(path, "w", newline = "") as out:
+        csv.writer(out, lineterminator = "\n").writerows(rows)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    STORE = snapshot_lib.SnapshotStore(args.store)
+
+    if args.action == "save":
+        if args.storage is None and args.mongo is None and args.unique is None:
+            save_parser.error("at least one of --storage, --mongo or --unique is required")
+
+        CUBE = cube_lib.load_cube_files(storage = args.storage, mongo = args.mongo, unique = args.unique)
+        STORE.save(CUBE, args.run, args.label, {"storage": args.storage, "mongo": args.mongo, "unique": args.unique})
+
+    elif args.action == "list":
+        write_rows(None, [["run", "label", "created", "start", "days", "collections"]] +
+                   [[entry["run"], entry["label"], entry["created"], entry["start"], entry["days"], len(entry["collections"])]
+                    for entry in STORE.runs()])
+
+    elif args.action == "delta":
+        dates, deltas = STORE.delta(args.old, args.new, args.metric, args.collection, args.start, args.end)
+        rows = [[date, delta] for date, delta in zip(dates.astype(str).tolist(), deltas.tolist())
+                if delta != 0 or not args.changed]
+        write_rows(args.output, [["date", args.metric + "_delta"]] + rows)
+
+    else:
+        runs, labels, totals = STORE.trend(args.metric, args.collection, args.period, args.start, args.end, args.label)
+        write_rows(args.output, [["run"] + labels] + [[run] + row for run, row in zip(runs, totals.tolist())])
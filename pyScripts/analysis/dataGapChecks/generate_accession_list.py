@@ -1,62 +1,39 @@
 ''' Script that takes in two lists of accession directory paths in form JSON: one from
-    MongoDB and one from PACS and generates a list of the difference in form CSV.
+    MongoDB and one from PACS and generates lists of the differences in form CSV.
 
     Sample run:
-        python3 generate_detailed_report.py -m path_to_mongo_list.csv -s path_to_pacs_list.csv 
+        python3 generate_accession_list.py -m path_to_mongo_list.json -s path_to_pacs_list.json
 
     For help:
-        python3 generate_detailed_report.py -h
+        python3 generate_accession_list.py -h
 
     Log:
         2020-01-14 - BP - Create base detailed report generator based on generate_report v0.2
 '''
-
-import json
+import os
+import sys
 import argparse
-import csv
-from datetime import datetime
-
-NOW = datetime.now()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # pyScripts/modules
+from modules import crawl_lib, diff_lib
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--storage", "-s", help = "Path to the storage counts file", type = str, required=True)
-parser.add_argument("--mongo", "-m", help = "Path to the mongo counts file", type = str, required=True)
-parser.add_argument("--diff", "-d", help = "Path to the diff file. Default to untouched_accession_paths.csv", type = str, required=False)
-
-def import_paths(filepath):
-    '''Imports access directory paths from .json files into a Python json object'''
-    with open(filepath) as paths_file:
-    paths_json = json.load(paths_file)
-
-    return paths_json
-
-def extract_diffs():
-    '''Creates a table of daily counts for the comparison of storage counts with MongoDB counts
-       based on the StudyDate tag and the DicomFilePath tag.
-    '''
-    with open(REPORT_NAME, "a+") as final_list:
-        print("Opened file...")
-
-        for year in STORAGE_LIST:
-            for month in STORAGE_LIST[year]:
-                for day in STORAGE_LIST[year][month]:
-                    print("Finding diff for {0}/{1}/{2}...".format(year, month, day))
-                    storage_paths = STORAGE_LIST[year][month][day]
-                    mongo_paths = MONGO_LIST[year][month][day]
-                    paths = list(set(storage_paths) - set(mongo_paths))
-
-                    for path in paths:
-                        final_list.write("/beegfs-hdruk/extract/v12/PACS/" + year + "/" + month + "/" + day + "/" + path + ",\n")
+parser.add_argument("--storage", "-s", help = "Path to the storage accession list file", type = str, required=True)
+parser.add_argument("--mongo", "-m", help = "Path to the mongo accession list file", type = str, required=True)
+parser.add_argument("--diff", "-d", help = "Path to the list of paths missing from MongoDB. Default to untouched_accession_paths.csv", type = str, required=False, default="untouched_accession_paths.csv")
+parser.add_argument("--orphans", "-o", help = "Path to the list of paths in MongoDB but not in storage. Default to orphaned_accession_paths.csv", type = str, required=False, default="orphaned_accession_paths.csv")
+parser.add_argument("--minyear", "-min", help = "Minimum for range of years to be diffed. Default to every year of either file.", type = int, required=False)
+parser.add_argument("--maxyear", "-max", help = "Maximum (exclusive) for range of years to be diffed.", type = int, required=False)
+parser.add_argument("--workers", "-w", help = "Number of years diffed in parallel. Default to 4.", type = int, required=False, default=4)
 
 if __name__ == '__main__':
     args = parser.parse_args()
 
-    STORAGE_LIST = import_paths(args.storage)
-    MONGO_LIST = import_paths(args.mongo)
-
-    if args.diff is None:
-        DIFF_NAME = ("untouched_accession_paths.csv")
+    if args.minyear is None or args.maxyear is None:
+        YEARS = None
     else:
-        DIFF_NAME = args.diff
+        YEARS = [str(year) for year in range(args.minyear, args.maxyear)]
+
+    results = diff_lib.diff_trees(args.storage, args.mongo, args.diff, args.orphans, crawl_lib.PACS_DIR, YEARS, args.workers)
 
-    extract_diffs()
\ No newline at end of file
+    print("Written {0} missing and {1} orphaned accession paths.".format(
+        sum(missing for missing, _ in results.values()), sum(orphaned for _, orphaned in results.values())))
@@ -1,5 +1,7 @@
 ''' Script that pulls MongoDB tag availability counts and creates a report of format .md.
 
+    The report format (.md, .csv or .html) follows the extension of the report path.
+
     This document includes:
         - date of reporting
         - reported tag, modality and path date
@@ -19,11 +21,14 @@
         2020-02-18 - BP - Sort tag counts and get the top 5 most available
 '''
 
-import json
 import argparse
 import operator
 from datetime import datetime
 from collections import Counter
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # pyScripts/modules
+from modules import columnar_lib, report_lib, stream_lib
 
 NOW = datetime.now()
 
@@ -31,15 +36,17 @@ parser = argparse.ArgumentParser()
 parser.add_argument("--modality", "-m", help = "String of the modality to be reported - mandatory for info", type = str, required=True)
 parser.add_argument("--tag", "-t", help = "String of the tag to be reported - mandatory for info", type = str, required=True)
 parser.add_argument("--year", "-y", help = "String list of years to be reported - mandatory for info", type = str, required=True)
-parser.add_argument("--counts", "-c", help = "Path to the tag counts - mandatory", type = str, required=True)
+parser.add_argument("--counts", "-c", help = "Path to the tag counts (e.g. a <tag>_<modality>.json file from mongo_tag_profile.py) - mandatory", type = str, required=True)
 parser.add_argument("--report", "-r", help = "Path to the report file - optional", type = str)
 
-def import_counts(path):
-    '''Imports counts from .json files into a Python json object'''
-    with open(path) as counts_file:
-    counts_json = json.load(counts_file)
+def import_counts(path, tag=None, modality=None):
+    '''Imports counts from .json files, or the given tag and modality of
+       .parquet/.arrow tag profiles written by modules/columnar_lib.py, into a
+       Python json object'''
+    if path.endswith((".parquet", ".arrow")):
+        return columnar_lib.read_tag_counts(path, tag, modality)
 
-    return counts_json
+    return stream_lib.load(path)
 
 def sort_dict(dictionary, sort_type):
     if sort_type == "asc":
@@ -49,34 +56,12 @@ def sort_dict(dictionary, sort_type):
 
     return dictionary
 
-def start_report(modality, tag, years):
-    '''Creates the report file and initialises it with a title, timestamp of the report creation,
-       modality, tag and years covered. The file name format is "tagAnalyisReport-YYYY_MM_DD.md".
-    '''
-    with open(REPORT_NAME, "w") as report_file:
-        report_header = "# MongoDB Tag Analysis Report\n"
-        report_header += ("### Performed on: {0}/{1}/{2} at {3}:{4}:{5}\n").format(
-                             NOW.year, NOW.month, NOW.day, NOW.hour, NOW.minute, NOW.second)
-        report_header += ("### Modality: {0}\n").format(modality)
-        report_header += ("### Tag: {0}\n").format(tag)
-        report_header += ("### Year(s): {0}\n").format(years)
-
-        report_file.write(report_header)
-
-def write_to_report(report_text):
-'''Appends text to the report created and initialised by start_report().'''
-    with open(REPORT_NAME, "a") as report_file:
-    report_file.write(report_text)
-
 def general_prop():
-'''Creates a table of general proportion (by year) of MongoDB objects that contain the reported tag.
+    '''Creates a table of general proportion (by year) of MongoDB objects that contain the reported tag.
     '''
-    report_text = "\n## Yearly proportion\n"
-    report_text += "| Year | Total Count | Containing Tag | Availability Percentage |\n"
-    report_text += "| ---- | ----------- | -------------- | ----------------------- |\n"
+    table = report_lib.Table("Yearly proportion", ["Year", "Total Count", "Containing Tag", "Availability Percentage"])
 
     for year in TAG_COUNTS:
-        report_text += ("| {0} | ").format(year)
         total_count = 0
         tag_count = 0
 
@@ -84,44 +69,37 @@ def general_prop():
             for day in TAG_COUNTS[year][month]:
                 total_count += TAG_COUNTS[year][month][day]["total_count"]
                 tag_count += TAG_COUNTS[year][month][day]["tag_count"]
-                availability = str("{:.2%}".format(tag_count/total_count))
 
-        report_text += ("{0} | {1} | {2} |\n").format(total_count, tag_count, availability)
+        availability = "{:.2%}".format(tag_count/total_count) if total_count else "n/a"
+        table.add_row(year, total_count, tag_count, availability)
 
-    write_to_report(report_text)
+    return table
 
 def tag_values():
-'''Creates a table of the top tag values and their proportion from the total number of objects that
+    '''Creates a table of the top tag values and their proportion from the total number of objects that
        contain the tag.
     '''
-    report_text = "\n## Most common values from those with the tag\n"
-    report_text += "| Value | Documents with value |\n"
-    report_text += "| ----- | -------------------- |\n"
+    table = report_lib.Table("Most common values from those with the tag", ["Value", "Documents with value"])
+    overall_values = Counter()
+    tag_count = 0
 
     for year in TAG_COUNTS:
-        overall_values = {}
-        tag_count = 0
-
         for month in TAG_COUNTS[year]:
             for day in TAG_COUNTS[year][month]:
                 if TAG_COUNTS[year][month][day]["values"] != 0:
-                    overall_values = dict(Counter(overall_values) + Counter(TAG_COUNTS[year][month][day]["values"]))
+                    overall_values.update(TAG_COUNTS[year][month][day]["values"])
                     tag_count += TAG_COUNTS[year][month][day]["tag_count"]
 
-    overall_values = dict(sort_dict(overall_values, "desc")[:5])
-
-    for value in overall_values:
-        availability = str("{:.2%}".format(overall_values[value]/tag_count))
-
-        report_text += ("| {0} | {1} |\n").format(value, availability)
+    for value, count in sort_dict(overall_values, "desc")[:5]:
+        table.add_row(value, "{:.2%}".format(count/tag_count))
 
-    write_to_report(report_text)
+    return table
 
 
 if __name__ == '__main__':
     args = parser.parse_args()
 
-    TAG_COUNTS = import_counts(args.counts)
+    TAG_COUNTS = import_counts(args.counts, args.tag, args.modality)
 
     if args.report is None:
         REPORT_NAME = ("reports/tagAnalysisReport-{0}-{1}-{2}_{3}:{4}:{5}.md").format(
@@ -129,6 +107,9 @@ if __name__ == '__main__':
     else:
         REPORT_NAME = args.report
 
-    start_report(args.modality, args.tag, args.year)
-    general_prop()
-    tag_values()
\ No newline at end of file
+    report = report_lib.Report("MongoDB Tag Analysis Report", [("Modality: {0}").format(args.modality),
+                                                                ("Tag: {0}").format(args.tag),
+                                                                ("Year(s): {0}").format(args.year)], NOW)
+    report.add_table(general_prop())
+    report.add_table(tag_values())
+    report.write(REPORT_NAME)
\ No newline at end of file
@@ -0,0 +1,35 @@
+'''Script for converting a nested JSON counts file into a typed columnar table
+   (Parquet, or Arrow IPC for .arrow outputs) that the report generators can
+   read in place of the JSON file. The JSON file is streamed, one day at a
+   time, rather than loaded whole.
+
+   Kinds:
+       mongo    {collection: {year: {month: {day: [DicomFilePath count, StudyDate count]}}}}
+       storage  {year: {month: {day: file count}}}
+       studies  {year: {month: {day: unique StudyInstanceUID count}}}
+
+   Usage:
+      python3 export_columnar.py -i mongoCounts.json -k mongo -o mongoCounts.parquet
+'''
+import argparse
+from modules import columnar_lib, stream_lib
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", "-i", help = "Path of the JSON counts file.", type = str, required = True)
+    parser.add_argument("--kind", "-k", help = "Kind of counts: mongo, storage or studies.", type = str, required = True, choices = ["mongo", "storage", "studies"])
+    parser.add_argument("--output", "-o", help = "Path of the .parquet or .arrow output.", type = str, required = True)
+    parser.add_argument("--batch", "-b", help = "Rows per row group/record batch. Default to 65536.", type = int, required = False, default = 65536)
+
+    return parser.parse_args()
+
+
+def main(args):
+    records = stream_lib.iter_records(args.input, depth=4 if args.kind == "mongo" else 3)
+    columnar_lib.write_records(records, args.output, args.kind, args.batch)
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
@@ -3,10 +3,15 @@
    This script outputs two files, a CSV list of the fileds in MariaDb and a copy of MongoDb
    tags with a flag indicator of whether they have been promoted to MariaDb or not.
 
+   The schema of every table is read in one information_schema query; with --cache it is
+   kept as a snapshot reused until the database's tables are next altered.
+
    Usage:
       python3 maria_list_fields.py -m CT -a ct_mongo_tags.csv -p ct_maria_tags.csv
+      python3 maria_list_fields.py -m CT -a ct_mongo_tags.csv -p ct_maria_tags.csv --cache schema_cache/
 '''
 import csv
+import sys
 import argparse
 from modules.maria_lib import DbLib
 
@@ -17,6 +22,7 @@ def argparser():
     parser.add_argument("--modality", "-m", help = "Modality name. (e.g. MR | CT). Default to all tables.", type = str, required = False, default="all")
     parser.add_argument("--available", "-a", help = "CSV list of available tags.", type = str, required = True)
     parser.add_argument("--processing", "-p", help = "Path for output list of processing tags.", type = str, required = True)
+    parser.add_argument("--cache", help = "Directory of the schema snapshot cache. Default to no caching.", type = str, required = False, default = None)
 
     return parser.parse_args()
 
@@ -33,6 +39,7 @@ def check_processed(fields, available):
        to indicate whether the tag has been promoted to MariaDb
        or not.
     '''
+    fields = set(fields)
     checklist_path = available.replace(".csv", "_checklist.csv")
 
     with open(available, 'r') as in_file, open(checklist_path, "w") as out_file:
@@ -55,17 +62,15 @@ def check_processed(fields, available):
 def main(args):
     db = DbLib()
     db.use_db(args.database)
-    tables = db.list_tables(args.modality)
-    fields = []
+    schema = db.get_schema(args.modality, args.cache)
 
-    for table in tables:
-        field_info_dict = db.get_table_field_info(table)
+    if schema is None:
+        db.disconnect()
+        sys.exit(1)
 
-        for field in field_info_dict:
-            fields.append(field)
+    fields = {field for field_info_dict in schema.values() for field in field_info_dict}
 
-    fields = sorted(list(set(fields)))
-    list_to_csv([[field] for field in fields], args.processing)
+    list_to_csv([[field] for field in sorted(fields)], args.processing)
     check_processed(fields, args.available)
 
     db.disconnect()
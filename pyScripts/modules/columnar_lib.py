@@ -0,0 +1,249 @@
+'''Library that flattens count trees and tag profiles into typed columnar
+   tables, written as Parquet or Arrow IPC files in row-group-sized batches,
+   and reads them back into the nested shapes used by the report generators.
+
+   Requires pyarrow. Files ending in .arrow are written in the Arrow IPC
+   streaming format, which allows each batch its own dictionaries, and any
+   other name as Parquet.
+'''
+import os
+import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CATEGORY = None if pa is None else pa.dictionary(pa.int32(), pa.string())
+
+## Table layouts: kind -> schema
+SCHEMAS = {} if pa is None else {
+    "mongo": pa.schema([("collection", CATEGORY), ("date", pa.date32()),
+                        ("path_count", pa.int64()), ("study_count", pa.int64())]),
+    "storage": pa.schema([("date", pa.date32()), ("files", pa.int64())]),
+    "studies": pa.schema([("date", pa.date32()), ("studies", pa.int64())]),
+    "tags": pa.schema([("tag", CATEGORY), ("modality", CATEGORY), ("year", pa.int16()),
+                       ("total_count", pa.int64()), ("tag_count", pa.int64()),
+                       ("value", CATEGORY), ("value_count", pa.int64())])
+}
+
+
+class ColumnarWriter:
+    def __init__(self, path, kind, batch_rows=65536):
+        '''Buffers rows of a given table kind and writes them out every
+           batch_rows rows, so each Parquet row group or Arrow record batch
+           is written as soon as it is full.
+        '''
+        if pa is None:
+            raise ImportError("pyarrow is required for columnar export")
+
+        self.path = path
+        self.schema = SCHEMAS[kind]
+        self.batch_rows = batch_rows
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+        self.tmp_path = path + ".tmp"
+
+        if path.endswith(".arrow"):
+            self.writer = ipc.new_stream(self.tmp_path, self.schema)
+        else:
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+
+
+    def write(self, row):
+        for name in self.schema.names:
+            self.columns[name].append(row[name])
+
+        self.rows += 1
+
+        if self.rows >= self.batch_rows:
+            self.flush()
+
+
+    def flush(self):
+        if self.rows == 0:
+            return
+
+        batch = pa.record_batch([pa.array(self.columns[field.name], field.type) for field in self.schema],
+                                schema=self.schema)
+
+        if isinstance(self.writer, pq.ParquetWriter):
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+        self.columns = {name: [] for name in self.schema.names}
+        self.rows = 0
+
+
+    def close(self, flush=True):
+        '''Closes the file and renames it into place, or, if not flushing
+           (on an error), removes it so that no partial table is left behind.
+        '''
+        if flush:
+            self.flush()
+
+        self.writer.close()
+
+        if not flush:
+            os.remove(self.tmp_path)
+            print(f"Failed writing columnar table {self.path}")
+            return
+
+        os.replace(self.tmp_path, self.path)
+        print(f"Successfully wrote columnar table {self.path}")
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(flush=exc_type is None)
+
+
+def day_rows(tree):
+    '''Yields (date, value) for each day of a {year: {month: {day: value}}} tree.'''
+    for year in tree:
+        for month in tree[year]:
+            for day, value in tree[year][month].items():
+                yield datetime.date(int(year), int(month), int(day)), value
+
+
+def mongo_rows(collection, tree):
+    '''Flattens one collection of count_by_day output into table rows.'''
+    for date, (path_count, study_count) in day_rows(tree):
+        yield {"collection": collection, "date": date, "path_count": path_count, "study_count": study_count}
+
+
+def count_rows(tree, column):
+    '''Flattens a {year: {month: {day: count}}} tree into table rows.'''
+    for date, count in day_rows(tree):
+        yield {"date": date, column: count}
+
+
+def record_rows(records, kind):
+    '''Turns the (key, ..., payload) records of a count tree of a given kind,
+       as yielded by stream_lib.iter_records, into table rows.
+    '''
+    if kind == "mongo":
+        for collection, year, month, day, (path_count, study_count) in records:
+            yield {"collection": collection, "date": datetime.date(int(year), int(month), int(day)),
+                   "path_count": path_count, "study_count": study_count}
+    else:
+        column = "files" if kind == "storage" else "studies"
+
+        for year, month, day, count in records:
+            yield {"date": datetime.date(int(year), int(month), int(day)), column: count}
+
+
+def tag_rows(profile, top=None):
+    '''Flattens a profile_lib.TagProfiler profile into one row per tag,
+       modality, year and kept value.
+    '''
+    for tag, modalities in profile.items():
+        for modality, years in modalities.items():
+            for year, stats in years.items():
+                if not year.isdigit():
+                    continue
+
+                values = stats["values"].top(top) or {None: 0}
+
+                for value, count in values.items():
+                    yield {"tag": tag, "modality": modality, "year": int(year),
+                           "total_count": stats["total_count"], "tag_count": stats["tag_count"],
+                           "value": value, "value_count": count}
+
+
+def write_counts(counts, path, kind, batch_rows=65536):
+    '''Writes a whole count tree of a given kind ("mongo", "storage" or
+       "studies") to a columnar file. Mongo collections whose count failed
+       (False rather than a tree) are reported and left out, and their names
+       returned.
+    '''
+    failed = []
+
+    if kind == "mongo":
+        failed = sorted(collection for collection, tree in counts.items() if not isinstance(tree, dict))
+        counts = {collection: tree for collection, tree in counts.items() if isinstance(tree, dict)}
+
+        for collection in failed:
+            print(f"Failed counts for {collection}, leaving it out of {path}")
+
+    with ColumnarWriter(path, kind, batch_rows) as writer:
+        if kind == "mongo":
+            rows = (row for collection, tree in counts.items() for row in mongo_rows(collection, tree))
+        else:
+            rows = count_rows(counts, "files" if kind == "storage" else "studies")
+
+        for row in rows:
+            writer.write(row)
+
+    return failed
+
+
+def write_records(records, path, kind, batch_rows=65536):
+    '''Writes a count tree of a given kind to a columnar file from its
+       stream_lib.iter_records records, so the tree is never held in memory.
+    '''
+    with ColumnarWriter(path, kind, batch_rows) as writer:
+        for row in record_rows(records, kind):
+            writer.write(row)
+
+
+def read_table(path):
+    if pa is None:
+        raise ImportError("pyarrow is required for columnar import")
+
+    if path.endswith(".arrow"):
+        with pa.memory_map(path) as source:
+            return ipc.open_stream(source).read_all()
+
+    return pq.read_table(path)
+
+
+def read_counts(path):
+    '''Reads a columnar count file back into the nested JSON shape:
+       {collection: {year: {month: {day: [path, study]}}}} for Mongo counts,
+       {year: {month: {day: count}}} for storage and unique-study counts.
+    '''
+    table = read_table(path)
+    columns = table.to_pydict()
+    counts = {}
+
+    for n, date in enumerate(columns["date"]):
+        year, month, day = str(date.year), f"{date.month:02d}", f"{date.day:02d}"
+
+        if "collection" in columns:
+            days = counts.setdefault(columns["collection"][n], {}).setdefault(year, {}).setdefault(month, {})
+            days[day] = [columns["path_count"][n], columns["study_count"][n]]
+        else:
+            value = columns["files" if "files" in columns else "studies"][n]
+            counts.setdefault(year, {}).setdefault(month, {})[day] = value
+
+    return counts
+
+
+def read_tag_counts(path, tag, modality):
+    '''Reads one tag and modality of a columnar tag profile back into the
+       {year: {"all": {"all": {"total_count", "tag_count", "values"}}}} shape
+       read by analysis/tagAnalysis/generate_tag_report.py.
+    '''
+    columns = read_table(path).to_pydict()
+    counts = {}
+
+    for n in range(len(columns["tag"])):
+        if columns["tag"][n] != tag or columns["modality"][n] != modality:
+            continue
+
+        stats = counts.setdefault(str(columns["year"][n]), {"all": {"all": {
+            "total_count": columns["total_count"][n], "tag_count": columns["tag_count"][n], "values": {}
+        }}})["all"]["all"]
+
+        if columns["value"][n] is not None:
+            stats["values"][columns["value"][n]] = columns["value_count"][n]
+
+    return dict(sorted(counts.items()))
@@ -0,0 +1,125 @@
+'''Library that holds the MongoDB connection settings and the clients shared
+   by every DbLib instance in a process.
+
+   Settings are read once from an optional INI file with a [mongo] section
+   (path in the MONGO_CONFIG env var, default ~/.smi_mongo.ini) and from the
+   HOST, USER, PASS and AUTHDB env vars, which take precedence:
+
+       [mongo]
+       pool_size = 100
+       compressors = zstd,snappy,zlib
+       read_preference = primary
+       socket_timeout_ms = 0
+       server_selection_timeout_ms = 30000
+       batch_size = 1000
+
+   Reads go to the primary by default, so that writes (deduplication, index
+   creation) and reads following them see the latest data. Read-only count
+   and report scripts opt in to secondaryPreferred through DbLib.
+'''
+import os
+import threading
+import configparser
+import bson
+import pymongo
+from pymongo import monitoring
+from modules import metrics_lib
+
+DEFAULT_CONFIG = os.path.expanduser("~/.smi_mongo.ini")
+
+DEFAULTS = {
+    "host": None,
+    "user": None,
+    "pass": None,
+    "authdb": None,
+    "pool_size": 100,
+    "compressors": "zstd,snappy,zlib",
+    "read_preference": "primary",
+    "socket_timeout_ms": 0,
+    "server_selection_timeout_ms": 30000,
+    "batch_size": 1000
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    '''Feeds the round-trip time and, if sizes are enabled, the reply size of
+       every command to metrics_lib.
+    '''
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if metrics_lib.enabled():
+            reply_bytes = len(bson.encode(event.reply)) if metrics_lib.sizes_enabled() else 0
+            metrics_lib.add_command_stats(event.duration_micros / 1e6, reply_bytes)
+
+    def failed(self, event):
+        if metrics_lib.enabled():
+            metrics_lib.add_command_stats(event.duration_micros / 1e6, 0)
+
+
+def load_settings(path=None):
+    '''Returns the connection settings from the config file, if any,
+       overridden by the env vars.
+    '''
+    settings = dict(DEFAULTS)
+    path = path or os.environ.get("MONGO_CONFIG", DEFAULT_CONFIG)
+
+    parser = configparser.ConfigParser()
+    parser.read(path)
+
+    if parser.has_section("mongo"):
+        for key, value in parser.items("mongo"):
+            if key in settings:
+                settings[key] = int(value) if isinstance(DEFAULTS[key], int) else value
+
+    for key in ("host", "user", "pass", "authdb"):
+        if os.environ.get(key.upper()) is not None:
+            settings[key] = os.environ.get(key.upper())
+
+    return settings
+
+
+def get_client(settings):
+    '''Returns the client for the given settings, creating it on first use.
+       Clients are shared between callers with identical settings.
+    '''
+    key = tuple(sorted(settings.items()))
+
+    with _lock:
+        if key not in _clients:
+            client = pymongo.MongoClient(
+                settings["host"],
+                username=settings["user"],
+                password=settings["pass"],
+                authSource=settings["authdb"],
+                maxPoolSize=settings["pool_size"],
+                compressors=settings["compressors"],
+                readPreference=settings["read_preference"],
+                socketTimeoutMS=settings["socket_timeout_ms"] or None,
+                serverSelectionTimeoutMS=settings["server_selection_timeout_ms"],
+                event_listeners=[CommandMetrics()]
+            )
+            _clients[key] = [client, 0]
+
+        _clients[key][1] += 1
+        return _clients[key][0]
+
+
+def release_client(client):
+    '''Releases one reference to a shared client and closes it once no
+       caller is using it any more.
+    '''
+    with _lock:
+        for key, entry in list(_clients.items()):
+            if entry[0] is client:
+                entry[1] -= 1
+
+                if entry[1] <= 0:
+                    del _clients[key]
+                    client.close()
+
+                return
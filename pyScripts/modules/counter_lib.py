@@ -0,0 +1,269 @@
+'''Library class that keeps per-day and per-modality document counts up to
+   date from a MongoDB change stream instead of recounting from scratch.
+'''
+import os
+import json
+import fnmatch
+import pymongo
+from bson import json_util
+from modules.mongo_lib import DbLib
+
+
+class LiveCounter:
+    def __init__(self, db_name, checkpoint, pattern="image_*", min_year=2010, max_year=2018):
+        self.lib = DbLib()
+        self.lib.switch_db(db_name)
+
+        self.checkpoint = checkpoint
+        self.pattern = pattern
+        self.min_year = min_year
+        self.max_year = max_year
+
+        self.resume_token = None
+        self.start_time = None
+        self.seeded = {}
+        self.days = {}
+        self.modalities = {}
+
+
+    def cluster_time(self):
+        '''Returns the current cluster time as a bson Timestamp.'''
+        return self.lib.db.command("ping")["operationTime"]
+
+
+    def check_pre_images(self, enable=False):
+        '''Checks that changeStreamPreAndPostImages is enabled on every
+           matching collection, without which deletes cannot be attributed to
+           a day, enabling it with collMod if enable is set. Returns the
+           collections left without it.
+        '''
+        missing = []
+
+        for info in self.lib.db.list_collections():
+            name = info["name"]
+            options = info.get("options", {})
+
+            if not fnmatch.fnmatch(name, self.pattern) or options.get("changeStreamPreAndPostImages", {}).get("enabled"):
+                continue
+
+            if enable:
+                self.lib.db.command({"collMod": name, "changeStreamPreAndPostImages": {"enabled": True}})
+                print(f"Successfully enabled changeStreamPreAndPostImages on {name}")
+            else:
+                missing.append(name)
+
+        return missing
+
+
+    def seed(self, collection):
+        '''Counts one collection from scratch and returns its day counts,
+           modality counts (either False on failure) and the cluster time
+           after counting. Change events up to that time are taken as already
+           counted; a change landing while the collection is being counted
+           may be missed or counted once, but never twice.
+        '''
+        days = self.lib.count_by_day(collection, self.min_year, self.max_year)
+        buckets = self.lib.count_by_modality(collection)
+        modalities = False if buckets is False else {str(bucket["_id"]): bucket["count"] for bucket in buckets}
+
+        return days, modalities, self.cluster_time()
+
+
+    def baseline(self):
+        '''Counts every matching collection from scratch. The change stream
+           is later opened at the cluster time taken before counting, so that
+           no change is lost, and the events of each collection are only
+           applied after the time at which it was counted.
+        '''
+        self.start_time = self.cluster_time()
+        self.resume_token = None
+        self.days = {}
+        self.modalities = {}
+        self.seeded = {}
+
+        for collection, (days, modalities, seeded) in self.lib.fan_out(self.seed, pattern=self.pattern).items():
+            self.days[collection] = days
+            self.modalities[collection] = modalities
+            self.seeded[collection] = seeded
+
+        print(f"Successfully took a baseline of {len(self.days)} collection(s)")
+        self.save()
+
+
+    def load(self):
+        '''Loads counters and resume token from the checkpoint file.
+           Returns False if there is no checkpoint to resume from.
+        '''
+        if not os.path.isfile(self.checkpoint):
+            return False
+
+        with open(self.checkpoint) as in_file:
+            state = json.load(in_file, object_hook=json_util.object_hook)
+
+        self.resume_token = state["resume_token"]
+        self.start_time = state.get("start_time")
+        self.seeded = state.get("seeded", {})
+        self.days = state["days"]
+        self.modalities = state["modalities"]
+
+        print(f"Successfully loaded checkpoint {self.checkpoint}")
+        return True
+
+
+    def save(self):
+        '''Atomically writes counters and resume token to the checkpoint file.'''
+        state = {
+            "resume_token": self.resume_token,
+            "start_time": self.start_time,
+            "seeded": self.seeded,
+            "days": self.days,
+            "modalities": self.modalities
+        }
+        tmp_path = self.checkpoint + ".tmp"
+
+        with open(tmp_path, "w") as out:
+            json.dump(state, out, default=json_util.default)
+
+        os.replace(tmp_path, self.checkpoint)
+
+
+    def apply(self, change):
+        '''Applies one insert or delete event to the in-memory counters.
+           Deletes are only attributed to a day and modality when the event
+           carries a pre-image (changeStreamPreAndPostImages enabled on the
+           collection); otherwise they are counted under "unattributed".
+           Events up to the time a collection was last counted are already
+           in its counts and skipped. A collection whose count failed is
+           recounted instead of having the change applied, and skipped while
+           it keeps failing.
+        '''
+        collection = change["ns"]["coll"]
+        seeded = self.seeded.get(collection)
+
+        if seeded is not None and change["clusterTime"] <= seeded:
+            return
+
+        if self.days.get(collection) is False or self.modalities.get(collection) is False:
+            self.reseed(collection)
+            return
+
+        if change["operationType"] == "insert":
+            doc = change["fullDocument"]
+            delta = 1
+        else:
+            doc = change.get("fullDocumentBeforeChange")
+            delta = -1
+
+        modalities = self.modalities.setdefault(collection, {})
+
+        if doc is None:
+            modalities["unattributed"] = modalities.get("unattributed", 0) + delta
+            return
+
+        modality = str(doc.get("Modality"))
+        modalities[modality] = modalities.get(modality, 0) + delta
+
+        days = self.days.setdefault(collection, {})
+        path = str((doc.get("header") or {}).get("DicomFilePath", ""))
+        study = str(doc.get("StudyDate", ""))
+
+        if len(path) >= 10:
+            self._bucket(days, path[0:4], path[5:7], path[8:10])[0] += delta
+
+        if len(study) >= 8:
+            self._bucket(days, study[0:4], study[4:6], study[6:8])[1] += delta
+
+
+    def reseed(self, collection):
+        '''Recounts a collection whose count failed. The recount includes the
+           change being applied and those landing while it runs, which are
+           skipped when they come through the stream.
+        '''
+        days, modalities, seeded = self.seed(collection)
+        self.days[collection] = days
+        self.modalities[collection] = modalities
+        self.seeded[collection] = seeded
+
+
+    def run(self, checkpoint_every=1000, counts_path=None, enable_pre_images=False):
+        '''Resumes from the checkpoint (or takes a baseline) and applies change
+           events until interrupted, checkpointing every given number of events.
+           If counts_path is given, the per-day counts are also written there in
+           the {collection: {year: {month: {day: [path, study]}}}} report format.
+           A new baseline is taken if the resume token has left the oplog.
+           Refuses to start unless changeStreamPreAndPostImages is enabled on
+           every matching collection, or enable_pre_images is set.
+        '''
+        missing = self.check_pre_images(enable_pre_images)
+
+        if missing:
+            raise RuntimeError("changeStreamPreAndPostImages is not enabled on " + ", ".join(missing) +
+                               ", so deletes could not be counted; enable it first")
+
+        while True:
+            if not self.load():
+                self.baseline()
+
+            try:
+                self._follow(checkpoint_every, counts_path)
+                return
+            except pymongo.errors.OperationFailure as error:
+                if error.code != 286:  # ChangeStreamHistoryLost
+                    raise
+
+                print(f"Resume token no longer in the oplog, taking a new baseline: {error}")
+                os.remove(self.checkpoint)
+
+
+    def _follow(self, checkpoint_every, counts_path):
+        pending = 0
+
+        try:
+            position = {"resume_after": self.resume_token} if self.resume_token else {"start_at_operation_time": self.start_time}
+
+            with self.lib.db.watch(self._pipeline(), full_document_before_change="whenAvailable", **position) as stream:
+                print("Successfully opened change stream")
+
+                for change in stream:
+                    self.apply(change)
+                    self.resume_token = stream.resume_token
+                    pending += 1
+
+                    if pending >= checkpoint_every:
+                        self.checkpoint_now(counts_path)
+                        pending = 0
+        except KeyboardInterrupt:
+            print("Stopping change stream")
+
+        self.checkpoint_now(counts_path)
+
+
+    def checkpoint_now(self, counts_path=None):
+        '''Saves the checkpoint and, optionally, the report-format counts.'''
+        self.save()
+
+        if counts_path is not None:
+            tmp_path = counts_path + ".tmp"
+
+            with open(tmp_path, "w") as out:
+                json.dump(self.days, out)
+
+            os.replace(tmp_path, counts_path)
+
+
+    def close(self):
+        self.lib.disconnect()
+
+
+    def _pipeline(self):
+        return [
+            {"$match": {
+                "operationType": {"$in": ["insert", "delete"]},
+                "ns.coll": {"$regex": fnmatch.translate(self.pattern)}
+            }}
+        ]
+
+
+    @staticmethod
+    def _bucket(days, year, month, day):
+        return days.setdefault(year, {}).setdefault(month, {}).setdefault(day, [0, 0])
@@ -0,0 +1,350 @@
+'''Library that crawls the PACS year/month/day/accession directory tree with
+   os.scandir, spreading small work units over a pool of processes.
+
+   One traversal lists every day directory once and feeds the record of each
+   day to a set of collectors, each producing its own output tree. Accession
+   directories are only listed in turn when a collector needs their files.
+
+   A DirManifest keeps the mtime and records of every day directory between
+   runs, so that later crawls only re-list the days that are new or changed.
+'''
+import os
+import abc
+import json
+import random
+import datetime
+import functools
+import multiprocessing
+from collections import OrderedDict
+
+## Path to PACS directory containing the year/month/day structure
+PACS_DIR = "/beegfs-hdruk/extract/v12/PACS"
+
+MONTHS = ["%02d" % month for month in range(1, 13)]
+
+
+def print_timestamped(string):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print("[" + timestamp + "] " + string)
+
+
+def list_subdirs(path, stat=False):
+    '''Returns the sorted names of the subdirectories of a path, using the
+       entry type cached by scandir instead of a stat per entry, or sorted
+       (name, mtime_ns) pairs with stat=True. Files are reported and skipped;
+       a missing path yields no subdirectories.
+    '''
+    names = []
+
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    names.append((entry.name, entry.stat().st_mtime_ns) if stat else entry.name)
+                else:
+                    print_timestamped("WARNING! Ignoring file " + entry.path + ".")
+    except FileNotFoundError:
+        print_timestamped(str(path) + " does not exist. Setting count for this directory to 0.")
+
+    return sorted(names)
+
+
+def scan_accession(study_path, sizes=False):
+    '''Returns [number of entries, total bytes] of an accession directory,
+       with bytes None unless sizes is set, as only sizes cost a stat per file.
+    '''
+    files = 0
+    total = 0
+
+    with os.scandir(study_path) as entries:
+        for entry in entries:
+            files += 1
+
+            if sizes:
+                total += entry.stat(follow_symlinks=False).st_size
+
+    return [files, total if sizes else None]
+
+
+def list_month(task):
+    '''Work unit: lists the day directories of one month with their mtimes.'''
+    year, month, month_path = task
+    return [(year, month, day, os.path.join(month_path, day), mtime) for day, mtime in list_subdirs(month_path, stat=True)]
+
+
+def list_day(task):
+    '''Work unit: lists the accession directories of one day.'''
+    year, month, day, day_path = task[:4]
+    return [(year, month, day, os.path.join(day_path, study)) for study in list_subdirs(day_path)]
+
+
+def list_names(task):
+    '''Work unit: returns the accession directory names of one day.'''
+    year, month, day, day_path = task[:4]
+    return year, month, day, list_subdirs(day_path)
+
+
+def scan_day(task, sizes=False):
+    '''Work unit: returns the record of every accession directory of one day.'''
+    year, month, day, day_path = task[:4]
+    return year, month, day, {study: scan_accession(os.path.join(day_path, study), sizes) for study in list_subdirs(day_path)}
+
+
+def scan_study(task, sizes=False):
+    '''Work unit: returns the record of one accession directory.'''
+    year, month, day, study_path = task
+    return year, month, day, {os.path.basename(study_path): scan_accession(study_path, sizes)}
+
+
+class Collector(abc.ABC):
+    '''Turns the {accession: [files, bytes]} record of each day into one
+       output value per day. Collectors setting sizes make the crawl stat
+       every file for its size; if no collector sets needs_files, accession
+       directories are not listed and the record is the list of their names.
+    '''
+    sizes = False
+    needs_files = True
+
+    @abc.abstractmethod
+    def collect(self, record):
+        pass
+
+
+class DayCounts(Collector):
+    '''Number of DICOM files per day.'''
+    def collect(self, record):
+        return sum(files for files, _ in record.values())
+
+
+class DayStudies(Collector):
+    '''Sorted accession directory names per day.'''
+    needs_files = False
+
+    def collect(self, record):
+        return sorted(record)
+
+
+class StudySizes(Collector):
+    '''Number of files and total bytes of each accession directory per day.'''
+    sizes = True
+
+    def collect(self, record):
+        return OrderedDict((study, {"files": files, "bytes": size}) for study, (files, size) in sorted(record.items()))
+
+
+## Collectors by output name
+COLLECTORS = {"counts": DayCounts, "studies": DayStudies, "sizes": StudySizes}
+
+
+def day_key(year, month, day):
+    return "/".join([year, month, day])
+
+
+class DirManifest:
+    def __init__(self, path, pacs_dir=PACS_DIR):
+        '''JSON cache of {"YYYY/MM/DD": {"mtime": ns, field: value}} for the
+           day directories of one PACS tree. A cached field is only trusted
+           while the day directory keeps the mtime it was recorded with.
+
+           Note that adding files to an existing accession directory does not
+           change the mtime of its day, so file counts of such days are only
+           refreshed by a full re-scan or caught by a check.
+        '''
+        self.path = path
+        self.pacs_dir = pacs_dir
+        self.days = {}
+
+        if os.path.exists(path):
+            with open(path) as manifest_file:
+                data = json.load(manifest_file)
+
+            if data.get("pacs_dir") == pacs_dir:
+                self.days = data["days"]
+            else:
+                print_timestamped("Manifest " + path + " was written for another PACS tree. Ignoring it.")
+
+
+    def get(self, key, mtime, field):
+        '''Returns the cached value of a field for a day, or None if the day
+           is new, has changed since, or the field was never recorded.
+        '''
+        entry = self.days.get(key)
+
+        if entry is None or entry["mtime"] != mtime:
+            return None
+
+        return entry.get(field)
+
+
+    def put(self, key, mtime, field, value):
+        entry = self.days.get(key)
+
+        if entry is None or entry["mtime"] != mtime:
+            entry = self.days[key] = {"mtime": mtime}
+
+        entry[field] = value
+
+
+    def prune(self, years, keys):
+        '''Drops the days of the given years that no longer exist.'''
+        years = {str(year) for year in years}
+
+        for key in list(self.days):
+            if key.split("/")[0] in years and key not in keys:
+                del self.days[key]
+
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+
+        with open(tmp_path, "w") as manifest_file:
+            json.dump({"pacs_dir": self.pacs_dir, "days": self.days}, manifest_file)
+
+        os.replace(tmp_path, self.path)
+        print_timestamped("Saved manifest of " + str(len(self.days)) + " day directories to " + self.path + ".")
+
+
+def split_cached(days, manifest, field, full=False):
+    '''Splits day units into those to re-list and {key: cached value}.'''
+    if manifest is None or full:
+        return days, {}
+
+    stale = []
+    cached = {}
+
+    for year, month, day, day_path, mtime in days:
+        value = manifest.get(day_key(year, month, day), mtime, field)
+
+        if value is None:
+            stale.append((year, month, day, day_path, mtime))
+        else:
+            cached[day_key(year, month, day)] = value
+
+    print_timestamped("Reusing " + str(len(cached)) + " cached day directories, re-listing " + str(len(stale)) + ".")
+    return stale, cached
+
+
+def check_cached(pool, days, cached, work, check):
+    '''Re-runs a day work unit over a random subset of check cached days
+       and returns {key: value} for those whose cached value was wrong.
+    '''
+    sample = random.sample([task for task in days if day_key(*task[:3]) in cached], min(check, len(cached)))
+    wrong = {}
+
+    for year, month, day, value in pool.imap_unordered(work, sample):
+        key = day_key(year, month, day)
+
+        if value != cached[key]:
+            print_timestamped("WARNING! Cached value for " + key + " is out of date: " + str(cached[key]) + " != " + str(value) + ".")
+            wrong[key] = value
+
+    print_timestamped("Checked " + str(len(sample)) + " cached day directories, " + str(len(wrong)) + " out of date.")
+    return wrong
+
+
+def empty_tree(years, init=OrderedDict):
+    '''Returns {year: {month: init()}} for every year and month.'''
+    return OrderedDict((str(year), OrderedDict((month, init()) for month in MONTHS)) for year in years)
+
+
+def list_all_days(pool, years, pacs_dir=PACS_DIR):
+    '''Lists every day directory of every year, one month per work unit.'''
+    tasks = [(str(year), month, os.path.join(pacs_dir, str(year), month)) for year in years for month in MONTHS]
+    return [day for days in pool.imap_unordered(list_month, tasks) for day in days]
+
+
+def merge_cached(tree, cached, days, years, manifest, field):
+    '''Merges the cached values into a freshly crawled tree, sorts its days
+       and records the whole tree in the manifest.
+    '''
+    mtimes = {day_key(year, month, day): mtime for year, month, day, _, mtime in days}
+
+    for key, value in cached.items():
+        year, month, day = key.split("/")
+        tree[year][month][day] = value
+
+    for year in tree:
+        for month in tree[year]:
+            tree[year][month] = OrderedDict(sorted(tree[year][month].items()))
+
+            if manifest is not None:
+                for day, value in tree[year][month].items():
+                    manifest.put(day_key(year, month, day), mtimes[day_key(year, month, day)], field, value)
+
+    if manifest is not None:
+        manifest.prune(years, mtimes)
+        manifest.save()
+
+    return tree
+
+
+def collect_tree(records, collector):
+    '''Maps a {year: {month: {day: record}}} tree through a collector.'''
+    tree = OrderedDict()
+
+    for year, months in records.items():
+        tree[year] = OrderedDict()
+
+        for month, days in months.items():
+            tree[year][month] = OrderedDict((day, collector.collect(record)) for day, record in days.items())
+
+    return tree
+
+
+def crawl(years, collectors, workers=12, granularity="day", pacs_dir=PACS_DIR, manifest=None, full=False, check=0):
+    '''Crawls the given years once and returns one {year: {month: {day: value}}}
+       tree per collector, in order.
+
+       All years are crawled at once from one shared queue of small work
+       units (days, or accession directories with granularity="accession"),
+       which idle processes pull from as soon as they finish, so no process
+       waits on the busiest month of a year.
+
+       With a DirManifest only new or changed days are re-listed, unless full
+       is set, and check cached days are re-listed to verify the cache.
+
+       Accession directories are only listed when a collector needs_files;
+       otherwise each day is a single listing, whatever the granularity.
+    '''
+    files = any(collector.needs_files for collector in collectors)
+    sizes = any(collector.sizes for collector in collectors)
+    field = "accession_sizes" if sizes else "accessions" if files else "accession_names"
+    work = functools.partial(scan_day, sizes=sizes) if files else list_names
+    records = empty_tree(years)
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        days = list_all_days(pool, years, pacs_dir)
+        print_timestamped("Listed " + str(len(days)) + " day directories.")
+        stale, cached = split_cached(days, manifest, field, full)
+
+        if check and cached:
+            cached.update(check_cached(pool, days, cached, work, check))
+
+        if granularity == "accession" and files:
+            for year, month, day, _, _ in stale:
+                records[year][month][day] = {}
+
+            studies = [study for found in pool.imap_unordered(list_day, stale) for study in found]
+            print_timestamped("Listed " + str(len(studies)) + " accession directories.")
+
+            for year, month, day, record in pool.imap_unordered(functools.partial(scan_study, sizes=sizes), studies, chunksize=64):
+                records[year][month][day].update(record)
+        else:
+            for year, month, day, record in pool.imap_unordered(work, stale):
+                records[year][month][day] = record
+
+    records = merge_cached(records, cached, days, years, manifest, field)
+
+    return [collect_tree(records, collector) for collector in collectors]
+
+
+def crawl_counts(years, workers=12, granularity="day", pacs_dir=PACS_DIR, manifest=None, full=False, check=0):
+    '''Returns {year: {month: {day: file count}}} for the given years.'''
+    return crawl(years, [DayCounts()], workers, granularity, pacs_dir, manifest, full, check)[0]
+
+
+def crawl_studies(years, workers=12, pacs_dir=PACS_DIR, manifest=None, full=False, check=0):
+    '''Returns {year: {month: {day: [accession directory names]}}} for the
+       given years.
+    '''
+    return crawl(years, [DayStudies()], workers, "day", pacs_dir, manifest, full, check)[0]
@@ -0,0 +1,192 @@
+'''Library that loads storage and MongoDB count trees once into a dense NumPy
+   cube of collection x day x metric, and rolls it up by day, month or year
+   for the count report generators.
+
+   Requires numpy.
+'''
+from collections import OrderedDict
+from modules import columnar_lib, stream_lib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+## Names of the non-Mongo rows of the cube
+STORAGE = "storage"
+UNIQUE = "unique"
+
+## Metrics held by the cube, and the metrics each kind of count tree fills
+METRICS = ["files", "path", "study", "studies"]
+TREE_METRICS = {STORAGE: ["files"], "mongo": ["path", "study"], UNIQUE: ["studies"]}
+
+## numpy datetime64 units of each rollup period
+PERIODS = {"day": "D", "month": "M", "year": "Y"}
+
+
+class CountCube:
+    def __init__(self, collections, years):
+        '''Zero counts for every collection and every day of the given years,
+           with a mask of the days present in each loaded tree.
+        '''
+        if np is None:
+            raise ImportError("numpy is required for the count cube")
+
+        self.collections = list(collections)
+        self.dates = np.arange(np.datetime64(f"{min(years)}-01-01"), np.datetime64(f"{max(years) + 1}-01-01"))
+        self.counts = np.zeros((len(self.collections), len(self.dates), len(METRICS)), dtype=np.int64)
+        self.present = np.zeros((len(self.collections), len(self.dates)), dtype=bool)
+        self.years = {}
+
+
+    def add_days(self, collection, days, values, metrics, years):
+        '''Loads the "YYYY-MM-DD" days of one collection, with values lists of
+           counts in the order of metrics, and records the years it covers.
+        '''
+        row = self.collections.index(collection)
+        columns = [METRICS.index(metric) for metric in metrics]
+        self.years[collection] = years
+
+        if days:
+            index = (np.array(days, dtype="datetime64[D]") - self.dates[0]).astype(np.int64)
+            self.counts[row, index[:, None], columns] = np.array(values, dtype=np.int64)
+            self.present[row, index] = True
+
+
+    def rollup(self, period="month", within=None):
+        '''Returns (labels, sums) with sums[collection, period, metric] summed
+           over the days of each period, or only over the days present in the
+           collection named by within.
+        '''
+        counts = self.counts
+
+        if within is not None:
+            counts = counts * self.present[self.collections.index(within)][None, :, None]
+
+        if period == "day":
+            return self.dates, counts
+
+        labels, starts = np.unique(self.dates.astype(f"datetime64[{PERIODS[period]}]"), return_index=True)
+        return labels, np.add.reduceat(counts, starts, axis=1)
+
+
+    def totals(self, collections, metric, period="month", within=None):
+        '''Returns {label: count} of a metric summed over the given collections
+           for each period, with labels "YYYY", "YYYY-MM" or "YYYY-MM-DD".
+        '''
+        labels, sums = self.rollup(period, within)
+        rows = [self.collections.index(collection) for collection in collections]
+        values = sums[rows, :, METRICS.index(metric)].sum(axis=0)
+
+        return OrderedDict(zip(labels.astype(str).tolist(), values.tolist()))
+
+
+    def calendar(self, collection):
+        '''Returns {year: {month: [day]}} of the days present in a collection's
+           tree, with every month of each of its years.
+        '''
+        row = self.collections.index(collection)
+        calendar = OrderedDict((year, OrderedDict((f"{month:02d}", []) for month in range(1, 13)))
+                               for year in self.years[collection])
+
+        for date in self.dates[self.present[row]].astype(str).tolist():
+            year, month, day = date.split("-")
+
+            if year in calendar:
+                calendar[year][month].append(day)
+
+        return calendar
+
+
+    @property
+    def mongo(self):
+        '''Names of the MongoDB collections of the cube.'''
+        return [collection for collection in self.collections if collection not in (STORAGE, UNIQUE)]
+
+
+def transfer_percentage(part, whole):
+    '''Element-wise 100 * part / whole, NaN where whole is 0.'''
+    part = np.asarray(part, dtype=np.float64)
+    whole = np.asarray(whole, dtype=np.float64)
+
+    return np.divide(part, whole, out=np.full(np.broadcast(part, whole).shape, np.nan), where=whole != 0) * 100
+
+
+def build_cube(sources):
+    '''Builds one cube from (collection, records, metrics) sources, with
+       records of (year, month, day, value) or, for a collection of None,
+       (collection, year, month, day, value). Storage comes first, then the
+       MongoDB collections sorted, then unique-study counts.
+    '''
+    days = OrderedDict()
+
+    for name, records, metrics in sources:
+        for record in records:
+            collection, (year, month, day, value) = (name, record) if name is not None else (record[0], record[1:])
+            entry = days.get(collection)
+
+            if entry is None:
+                entry = days[collection] = {"metrics": metrics, "years": [], "days": [], "values": []}
+
+            if year not in entry["years"]:
+                entry["years"].append(year)
+
+            entry["days"].append(f"{year}-{month}-{day}")
+            entry["values"].append(value if isinstance(value, list) else [value])
+
+    order = {STORAGE: 0, UNIQUE: 2}
+    collections = sorted(days, key=lambda collection: (order.get(collection, 1), collection))
+    cube = CountCube(collections, [int(year) for entry in days.values() for year in entry["years"]])
+
+    for collection in collections:
+        entry = days[collection]
+        cube.add_days(collection, entry["days"], entry["values"], entry["metrics"], entry["years"])
+
+    return cube
+
+
+def load_cube(storage=None, mongo=None, unique=None):
+    '''Builds one cube from a storage counts tree, a {collection: tree} of
+       MongoDB [path, study] counts and a unique-study counts tree, any of
+       which may be left out.
+    '''
+    sources = []
+
+    if storage is not None:
+        sources.append((STORAGE, stream_lib.walk_tree(storage, 3), TREE_METRICS[STORAGE]))
+
+    if mongo is not None:
+        sources.append((None, stream_lib.walk_tree(mongo, 4), TREE_METRICS["mongo"]))
+
+    if unique is not None:
+        sources.append((UNIQUE, stream_lib.walk_tree(unique, 3), TREE_METRICS[UNIQUE]))
+
+    return build_cube(sources)
+
+
+def count_records(path, depth):
+    '''Streams the records of a .json count file, or reads those of a
+       .parquet/.arrow file written by modules/columnar_lib.py.
+    '''
+    if path.endswith((".parquet", ".arrow")):
+        return stream_lib.walk_tree(columnar_lib.read_counts(path), depth)
+
+    return stream_lib.iter_records(path, depth)
+
+
+def load_cube_files(storage=None, mongo=None, unique=None):
+    '''Builds one cube from the paths of count files as in load_cube,
+       streaming each file a day at a time instead of loading its tree.
+    '''
+    sources = []
+
+    if storage is not None:
+        sources.append((STORAGE, count_records(storage, 3), TREE_METRICS[STORAGE]))
+
+    if mongo is not None:
+        sources.append((None, count_records(mongo, 4), TREE_METRICS["mongo"]))
+
+    if unique is not None:
+        sources.append((UNIQUE, count_records(unique, 3), TREE_METRICS[UNIQUE]))
+
+    return build_cube(sources)
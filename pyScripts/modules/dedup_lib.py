@@ -0,0 +1,191 @@
+'''Library class that removes documents duplicated by header.DicomFilePath
+   from the image collections.
+'''
+import os
+import re
+import time
+import pymongo
+from pymongo import DeleteOne
+import modules.file_lib as flib
+from modules.mongo_lib import PATH_INDEX, path_filter
+
+## Day prefixes of DicomFilePath ("yyyy/mm/dd") and StudyDate ("yyyymmdd")
+PATH_DAY = re.compile(r"(\d{4})/(\d{2})/(\d{2})")
+STUDY_DAY = re.compile(r"(\d{4})(\d{2})(\d{2})")
+
+
+class Deduplicator:
+    def __init__(self, lib, chunk_size=1000, batch_size=None, dry_run=False, manifest_dir=None):
+        '''Wraps a connected mongo_lib.DbLib. Duplicate groups are pulled from
+           the server batch_size at a time and deletions are sent in
+           bulk_write chunks of chunk_size. In a dry run nothing is deleted.
+        '''
+        self.lib = lib
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size or lib.settings["batch_size"]
+        self.dry_run = dry_run
+        self.manifest_dir = manifest_dir
+        self.touched = {}
+
+
+    def run(self, pattern="image_*", workers=4):
+        '''Deduplicates every collection matching a pattern in parallel and
+           returns {collection: stats}.
+        '''
+        return self.lib.fan_out(self.dedup_collection, pattern=pattern, workers=workers)
+
+
+    def dedup_collection(self, collection):
+        '''Deduplicates one collection, keeping the document with the lowest
+           _id for each DicomFilePath. If a manifest directory is set, every
+           duplicate group is recorded in <collection>_duplicates.ndjson.
+           The DicomFilePath and StudyDate days of every group are recorded
+           in self.touched, even if the run fails part way. The DicomFilePath
+           index the duplicated documents are fetched by is created if
+           missing. Returns the counts and rates of the run, where scanned is
+           the number of documents grouped.
+        '''
+        stats = {"scanned": 0, "groups": 0, "deleted": 0}
+        touched = self.touched[collection] = {"path": set(), "study": set()}
+        start = time.monotonic()
+
+        try:
+            if not self.lib.ensure_index(collection, PATH_INDEX):
+                raise RuntimeError("no index on header.DicomFilePath")
+
+            groups = self._groups(collection, stats, touched)
+
+            if self.manifest_dir is None:
+                for _ in groups:
+                    pass
+            else:
+                manifest = os.path.join(self.manifest_dir, f"{collection}_duplicates.ndjson")
+                result = flib.stream_dump(groups, manifest)
+
+                if result is not True:
+                    raise result
+
+            seconds = time.monotonic() - start
+            stats["seconds"] = round(seconds, 3)
+            stats["docs_per_sec"] = round(stats["scanned"] / seconds, 1) if seconds else None
+            stats["deletes_per_sec"] = round(stats["deleted"] / seconds, 1) if seconds else None
+
+            action = "found" if self.dry_run else "deleted"
+            print(f"Successfully deduplicated {collection}: {action} {stats['deleted']} duplicate(s) "
+                  f"in {stats['groups']} group(s), {stats['docs_per_sec']} docs/s, "
+                  f"{stats['deletes_per_sec']} deletes/s")
+            return stats
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed deduplicating {collection}: {error}")
+            return False
+
+
+    def write_touched(self, path):
+        '''Writes the days touched by the run as {collection: {"path": [day],
+           "study": [day]}}, with "YYYY-MM-DD" days, for
+           mongo_counts_by_day.py to recount. Collections without deletions
+           are left out. Nothing is written on a dry run, which deletes
+           nothing; False is returned instead.
+        '''
+        if self.dry_run:
+            print(f"Not writing touched days to {path} on a dry run")
+            return False
+
+        touched = {
+            collection: {metric: sorted(days) for metric, days in metrics.items()}
+            for collection, metrics in self.touched.items() if metrics["path"] or metrics["study"]
+        }
+
+        return flib.json_dump(touched, path)
+
+
+    def _groups(self, collection, stats, touched):
+        '''Yields one manifest entry per duplicate group, deleting the extra
+           documents in chunks along the way unless this is a dry run. The
+           server only counts documents per DicomFilePath and folds the
+           unique paths into a single null group, so that every grouped
+           document is counted; the ids of the duplicated paths are then
+           fetched chunk_size paths at a time through the DicomFilePath index.
+           Documents without a string DicomFilePath are never grouped.
+        '''
+        query = [
+            {"$match": {"header.DicomFilePath": {"$type": "string"}}},
+            {"$group": {"_id": "$header.DicomFilePath", "count": {"$sum": 1}}},
+            {"$group": {"_id": {"$cond": [{"$gt": ["$count", 1]}, "$_id", None]}, "count": {"$sum": "$count"}}}
+        ]
+        paths = []
+        pending = []
+
+        cursor = self.lib.db[collection].aggregate(query, allowDiskUse=True, batchSize=self.batch_size)
+
+        for group in cursor:
+            stats["scanned"] += group["count"]
+
+            if group["_id"] is None:
+                continue
+
+            paths.append(group["_id"])
+
+            if len(paths) >= self.chunk_size:
+                yield from self._resolve(collection, paths, stats, touched, pending)
+                paths = []
+
+        yield from self._resolve(collection, paths, stats, touched, pending)
+        self._delete(collection, pending)
+
+
+    def _resolve(self, collection, paths, stats, touched, pending):
+        '''Fetches the documents of a chunk of duplicated paths and yields
+           their groups, keeping the lowest _id of each. The group's
+           DicomFilePath day and the StudyDate days of its documents are added
+           to touched before anything is deleted.
+        '''
+        if not paths:
+            return
+
+        documents = {}
+        cursor = self.lib.db[collection].find(path_filter(paths),
+                                              {"header.DicomFilePath": 1, "StudyDate": 1},
+                                              batch_size=self.batch_size)
+
+        for doc in cursor:
+            documents.setdefault(doc["header"]["DicomFilePath"], []).append(doc)
+
+        for path in paths:
+            group = documents.get(path, [])
+
+            if len(group) < 2:  # Removed since the groups were counted
+                continue
+
+            keep = min(doc["_id"] for doc in group)
+            duplicates = sorted(doc["_id"] for doc in group if doc["_id"] != keep)
+            stats["groups"] += 1
+            stats["deleted"] += len(duplicates)
+            pending.extend(duplicates)
+            add_day(touched["path"], PATH_DAY, path)
+
+            for doc in group:
+                add_day(touched["study"], STUDY_DAY, doc.get("StudyDate"))
+
+            if len(pending) >= self.chunk_size:
+                self._delete(collection, pending)
+                pending.clear()
+
+            yield {"path": path, "keep": keep, "delete": duplicates}
+
+
+    def _delete(self, collection, ids):
+        if self.dry_run or not ids:
+            return
+
+        self.lib.db[collection].bulk_write([DeleteOne({"_id": _id}) for _id in ids], ordered=False)
+
+
+def add_day(days, pattern, value):
+    '''Adds the "YYYY-MM-DD" day of a value starting with a date matching
+       pattern to days.
+    '''
+    match = pattern.match(value) if isinstance(value, str) else None
+
+    if match is not None:
+        days.add("-".join(match.groups()))
@@ -0,0 +1,131 @@
+'''Library that diffs two {year: {month: {day: [accession]}}} JSON trees, one
+   from storage and one from MongoDB, streaming both a day at a time and
+   merging their sorted accession lists, with one process per year.
+'''
+import os
+import csv
+import shutil
+import tempfile
+import multiprocessing
+from modules import stream_lib
+
+
+def sorted_unique(items):
+    '''Yields the distinct items of a list in sorted order, sorting only if
+       the list is not sorted already.
+    '''
+    if any(items[n] > items[n + 1] for n in range(len(items) - 1)):
+        items = sorted(items)
+
+    previous = None
+
+    for n, item in enumerate(items):
+        if n == 0 or item != previous:
+            yield item
+
+        previous = item
+
+
+def merge_diff(left, right):
+    '''Linear merge of two sorted lists. Yields ("left", item) for items only
+       in left and ("right", item) for items only in right.
+    '''
+    left = sorted_unique(left)
+    right = sorted_unique(right)
+    a = next(left, None)
+    b = next(right, None)
+
+    while a is not None or b is not None:
+        if b is None or (a is not None and a < b):
+            yield "left", a
+            a = next(left, None)
+        elif a is None or b < a:
+            yield "right", b
+            b = next(right, None)
+        else:
+            a = next(left, None)
+            b = next(right, None)
+
+
+def merge_days(storage_days, mongo_days):
+    '''Aligns two streams of (year, month, day, accessions) in date order,
+       yielding (year, month, day, storage accessions, mongo accessions) with
+       [] for a day missing from one side.
+    '''
+    storage_day = next(storage_days, None)
+    mongo_day = next(mongo_days, None)
+    last = None
+
+    while storage_day is not None or mongo_day is not None:
+        if mongo_day is None or (storage_day is not None and storage_day[:3] < mongo_day[:3]):
+            date, storage, mongo = storage_day[:3], storage_day[3], []
+            storage_day = next(storage_days, None)
+        elif storage_day is None or mongo_day[:3] < storage_day[:3]:
+            date, storage, mongo = mongo_day[:3], [], mongo_day[3]
+            mongo_day = next(mongo_days, None)
+        else:
+            date, storage, mongo = storage_day[:3], storage_day[3], mongo_day[3]
+            storage_day = next(storage_days, None)
+            mongo_day = next(mongo_days, None)
+
+        if last is not None and date <= last:
+            raise ValueError(f"Days are not in sorted order: {'/'.join(date)} after {'/'.join(last)}")
+
+        last = date
+        yield date + (storage, mongo)
+
+
+def diff_year(task):
+    '''Work unit: writes the accession paths of one year missing from MongoDB
+       and orphaned in MongoDB to two part files, returning their counts.
+    '''
+    storage_path, mongo_path, year, prefix, missing_path, orphaned_path = task
+    counts = {"left": 0, "right": 0}
+
+    with open(missing_path, "w", newline="") as missing_file, open(orphaned_path, "w", newline="") as orphaned_file:
+        writers = {"left": csv.writer(missing_file, lineterminator="\n"),
+                   "right": csv.writer(orphaned_file, lineterminator="\n")}
+        days = merge_days(stream_lib.iter_days(storage_path, {year}), stream_lib.iter_days(mongo_path, {year}))
+
+        for _, month, day, storage, mongo in days:
+            for side, accession in merge_diff(storage, mongo):
+                writers[side].writerow(["/".join([prefix, year, month, day, accession])])
+                counts[side] += 1
+
+    print(f"Successfully diffed {year}: {counts['left']} missing from MongoDB, {counts['right']} orphaned")
+    return year, counts["left"], counts["right"]
+
+
+def concat(parts, path):
+    '''Atomically writes the concatenation of part files to a path.'''
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as out:
+        for part in parts:
+            with open(part, "rb") as part_file:
+                shutil.copyfileobj(part_file, out)
+
+    os.replace(tmp_path, path)
+
+
+def diff_trees(storage_path, mongo_path, missing_path, orphaned_path, prefix, years=None, workers=4):
+    '''Writes the accession paths in storage but not in MongoDB to
+       missing_path and those in MongoDB but not in storage to orphaned_path,
+       one path per CSV row in date order. Years default to every year of
+       either tree. Returns {year: (missing, orphaned)}.
+    '''
+    if years is None:
+        years = sorted(set(stream_lib.list_years(storage_path)) | set(stream_lib.list_years(mongo_path)))
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(missing_path))) as tmp_dir:
+        tasks = [(storage_path, mongo_path, year, prefix,
+                  os.path.join(tmp_dir, f"missing_{year}.csv"), os.path.join(tmp_dir, f"orphaned_{year}.csv"))
+                 for year in years]
+
+        with multiprocessing.Pool(processes=workers) as pool:
+            results = pool.map(diff_year, tasks)
+
+        concat([task[4] for task in tasks], missing_path)
+        concat([task[5] for task in tasks], orphaned_path)
+
+    return {year: (missing, orphaned) for year, missing, orphaned in results}
@@ -3,7 +3,9 @@
 '''
 import os
 import glob
+import gzip
 import json
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from bson import json_util
 
 def json_dump(data, filename):
@@ -17,6 +19,81 @@ def json_dump(data, filename):
         return e
 
 
+def stream_dump(data, filename, fmt="ndjson", buffer_size=1 << 20):
+    '''Writes the documents of an iterable (e.g. a cursor or a generator) one
+       at a time as NDJSON or, with fmt="json", as a JSON array, holding at
+       most buffer_size characters before flushing. Files ending in .gz are
+       gzip-compressed. Output goes to a temporary file that is renamed into
+       place once complete, so readers never see a partial file.
+    '''
+    opener = gzip.open if filename.endswith(".gz") else open
+    separator = "\n" if fmt == "ndjson" else ",\n"
+    tmp_path = filename + ".tmp"
+
+    try:
+        with opener(tmp_path, "wt") as out:
+            buffer = []
+            size = 0
+            count = 0
+
+            if fmt == "json":
+                out.write("[\n")
+
+            for doc in data:
+                chunk = json.dumps(doc, default=json_util.default)
+
+                if fmt == "ndjson":
+                    chunk += separator
+                elif count > 0:
+                    chunk = separator + chunk
+
+                buffer.append(chunk)
+                size += len(chunk)
+                count += 1
+
+                if size >= buffer_size:
+                    out.write("".join(buffer))
+                    buffer = []
+                    size = 0
+
+            out.write("".join(buffer))
+
+            if fmt == "json":
+                out.write("\n]\n")
+
+        os.replace(tmp_path, filename)
+        print(f"Successfully streamed {count} document(s) to {filename}.")
+        return True
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        return e
+
+
+def dump_each(data, filenames, workers=8):
+    '''Writes each document of an iterable to its own JSON file, pairing
+       documents with filenames in order, on a pool of threads. At most
+       twice as many documents as workers are held at a time.
+       Returns the number of files written.
+    '''
+    written = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        for doc, filename in zip(data, filenames):
+            pending.add(pool.submit(json_dump, doc, filename))
+
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written += sum(future.result() is True for future in done)
+
+        written += sum(future.result() is True for future in pending)
+
+    return written
+
+
 def ls_dir(path, extension="csv"):
     try:
         return glob.glob(os.path.join(path, f"*.{extension}"))
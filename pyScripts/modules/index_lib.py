@@ -0,0 +1,174 @@
+'''Library class that explains the query shapes used by DbLib against each
+   collection and advises on missing and unused indexes.
+'''
+import pymongo
+from modules.mongo_lib import (PATH_INDEX, STUDY_INDEX, MODALITY_INDEX, STRATUM_INDEX, DAY_BUCKET_STAGES,
+                               stratum_filter, path_filter, days_filter, modality_query, unique_vals_query)
+
+## Index of the DirectoryPath day scan of mongoListAccessionPaths.js
+DIRECTORY_INDEX = [("header.DirectoryPath", pymongo.ASCENDING)]
+
+
+def query_shapes(day="2016-01-01", modality="MR", tag="Modality"):
+    '''Returns the query shapes run by DbLib, Deduplicator and the JS
+       scripts, built from the same filters and pipelines, for a given day,
+       modality and tag, as name -> (indexes, pipeline). The indexes are the
+       (field, direction) keys the shape needs, compound where it filters and
+       sorts on several fields, one per $or branch; shapes with no index
+       are full passes, explained but never advised on.
+    '''
+    study_day = day.replace("-", "")
+    segment = {"StudyDate": {"$gte": study_day, "$lt": str(int(study_day) + 1)}}
+
+    return {
+        "count_days": ([PATH_INDEX, STUDY_INDEX], [
+            {"$match": days_filter([day], [day])}
+        ] + DAY_BUCKET_STAGES),
+        "dedup_resolve": ([PATH_INDEX], [
+            {"$match": path_filter([day.replace("-", "/")])}
+        ]),
+        "stratified_sample": ([STRATUM_INDEX], [
+            {"$match": stratum_filter(modality, segment)},
+            {"$sort": {field: direction for field, direction in STRATUM_INDEX}},
+            {"$limit": 100}
+        ]),
+        "count_modality": ([MODALITY_INDEX], modality_query(modality)),
+        "count_by_modality": ([], modality_query()),
+        "list_unique_vals": ([], unique_vals_query(tag)),
+        "directory_path_by_day": ([DIRECTORY_INDEX], [
+            {"$match": {"header.DirectoryPath": {"$regex": "^" + day.replace("-", "/")}}}
+        ])
+    }
+
+
+## Query shapes for the default day, modality and tag
+QUERY_SHAPES = query_shapes()
+
+
+class IndexAdvisor:
+    def __init__(self, lib, shapes=QUERY_SHAPES, verbosity="queryPlanner"):
+        '''Wraps a connected mongo_lib.DbLib. With the default queryPlanner
+           verbosity plans are chosen without running the queries; use
+           "executionStats" to also get keys and documents examined, at the
+           cost of executing every shape.
+        '''
+        self.lib = lib
+        self.shapes = shapes
+        self.verbosity = verbosity
+
+
+    def run(self, pattern="image_*", workers=4):
+        '''Advises on every collection matching a pattern and returns
+           {collection: advice}.
+        '''
+        return self.lib.fan_out(self.advise, pattern=pattern, workers=workers)
+
+
+    def advise(self, collection):
+        '''Explains every query shape against a collection and returns the
+           winning plans, the indexes never used since the last restart and
+           the indexes, as lists of (field, direction) keys, to create for
+           shapes that scan the whole collection although an index could
+           serve them. An index is only advised if no index starts with its
+           keys.
+        '''
+        try:
+            indexes = self.lib.list_indexes(collection) or []
+            existing = [list(info["key"]) for info in self.lib.db[collection].index_information().values()]
+            plans = {name: self.explain(collection, pipeline) for name, (_, pipeline) in self.shapes.items()}
+            create = []
+
+            for name, plan in plans.items():
+                if "COLLSCAN" not in plan["stages"]:
+                    continue
+
+                for keys in self.shapes[name][0]:
+                    keys = list(keys)
+
+                    if keys not in create and not any(index[:len(keys)] == keys for index in existing):
+                        create.append(keys)
+
+            advice = {
+                "indexes": indexes,
+                "plans": plans,
+                "unused": self.unused_indexes(collection),
+                "create": create
+            }
+            print(f"Successfully advised on indexes for {collection}")
+            return advice
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed advising on indexes for {collection}: {error}")
+            return False
+
+
+    def explain(self, collection, pipeline):
+        '''Returns the winning plan stages of an aggregation and, with
+           executionStats verbosity, the keys and documents examined against
+           the documents returned.
+        '''
+        result = self.lib.db.command({
+            "explain": {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+            "verbosity": self.verbosity
+        })
+        planner = find_key(result, "queryPlanner") or {}
+        stats = find_key(result, "executionStats") or {}
+
+        return {
+            "stages": plan_stages(planner.get("winningPlan", {})),
+            "keys_examined": stats.get("totalKeysExamined"),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "returned": stats.get("nReturned"),
+            "millis": stats.get("executionTimeMillis")
+        }
+
+
+    def unused_indexes(self, collection):
+        '''Returns the names of indexes with no recorded accesses in $indexStats.'''
+        stats = self.lib.db[collection].aggregate([{"$indexStats": {}}])
+        return sorted(index["name"] for index in stats
+                      if index["name"] != "_id_" and index["accesses"]["ops"] == 0)
+
+
+    def apply(self, advice):
+        '''Creates the indexes advised for each collection.'''
+        for collection, result in advice.items():
+            if not result:
+                continue
+
+            for keys in result["create"]:
+                self.lib.ensure_index(collection, [tuple(key) for key in keys])
+
+
+def find_key(doc, key):
+    '''Returns the first value found under a key in a nested explain output.'''
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+
+        values = doc.values()
+    elif isinstance(doc, list):
+        values = doc
+    else:
+        return None
+
+    for value in values:
+        found = find_key(value, key)
+
+        if found is not None:
+            return found
+
+    return None
+
+
+def plan_stages(plan):
+    '''Flattens a winning plan tree into its list of stage names.'''
+    plan = plan.get("queryPlan", plan)
+    stages = [plan["stage"]] if "stage" in plan else []
+
+    if "inputStage" in plan:
+        stages += plan_stages(plan["inputStage"])
+
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+
+    return stages
@@ -1,9 +1,28 @@
 '''Library class that holds general database-related functionality
 '''
 import os
+import sys
+import json
+import tempfile
 import mariadb
-
-
+from modules import metrics_lib
+
+## information_schema DATA_TYPE -> type name of mariadb.fieldinfo() for a cursor column
+FIELD_TYPES = {
+    "tinyint": "TINY", "smallint": "SHORT", "mediumint": "INT24", "int": "LONG", "integer": "LONG",
+    "bigint": "LONGLONG", "float": "FLOAT", "double": "DOUBLE", "decimal": "NEWDECIMAL",
+    "bit": "BIT", "year": "YEAR", "date": "DATE", "time": "TIME", "datetime": "DATETIME",
+    "timestamp": "TIMESTAMP", "char": "STRING", "binary": "STRING", "enum": "STRING", "set": "STRING",
+    "varchar": "VAR_STRING", "varbinary": "VAR_STRING", "inet6": "STRING", "uuid": "STRING",
+    "tinytext": "BLOB", "text": "BLOB", "mediumtext": "BLOB", "longtext": "BLOB", "json": "BLOB",
+    "tinyblob": "BLOB", "blob": "BLOB", "mediumblob": "BLOB", "longblob": "BLOB",
+    "geometry": "GEOMETRY", "point": "GEOMETRY", "linestring": "GEOMETRY", "polygon": "GEOMETRY",
+    "multipoint": "GEOMETRY", "multilinestring": "GEOMETRY", "multipolygon": "GEOMETRY",
+    "geometrycollection": "GEOMETRY"
+}
+
+
+@metrics_lib.instrument("maria")
 class DbLib:
     def __init__(self):
         self.conn = None
@@ -67,6 +86,65 @@ class DbLib:
         return field_info_dict
 
 
+    def ddl_version(self):
+        '''Returns [database, table count, latest CREATE_TIME, latest
+           UPDATE_TIME, column count] of the current database, read from
+           information_schema without touching the column definitions.
+           Creating, dropping or rebuilding a table, or adding or dropping a
+           column, changes the version; an in-place ALTER keeping the column
+           count and CREATE_TIME (such as a rename) does not, while writes
+           moving UPDATE_TIME do, at the cost of a schema refetch.
+        '''
+        self.cur.execute(
+            "SELECT DATABASE(), COUNT(*), CAST(MAX(CREATE_TIME) AS CHAR), CAST(MAX(UPDATE_TIME) AS CHAR), "
+            "(SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()) "
+            "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"
+        )
+
+        return list(self.cur.fetchone())
+
+
+    def get_schema(self, content="all", cache_dir=None):
+        '''Retrieves the field info of every table of the current database
+           whose name contains content (or of all tables), as
+           {table: {column: {"type": type, "flags": flags}}}, from a single
+           information_schema.COLUMNS query. Types are named as
+           mariadb.fieldinfo().type names them for a cursor column, and flags
+           cover nullability, keys, signedness, auto-increment, blob, enum and
+           set, but not the other flags of a cursor column (such as BINARY).
+           With a cache_dir the schema snapshot is kept in
+           <cache_dir>/<database>.schema.json and reused until the database's
+           DDL version changes.
+        '''
+        try:
+            version = self.ddl_version()
+            snapshot_path = None if cache_dir is None else os.path.join(cache_dir, f"{version[0]}.schema.json")
+            schema = load_snapshot(snapshot_path, version)
+
+            if schema is None:
+                schema = {}
+                self.cur.execute(
+                    "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, EXTRA "
+                    "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                    "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+                )
+
+                for table, column, data_type, column_type, nullable, key, extra in self.cur.fetchall():
+                    schema.setdefault(table, {})[column] = {
+                        "type": FIELD_TYPES.get(data_type.lower(), data_type.upper()),
+                        "flags": column_flags(column_type, nullable, key, extra)
+                    }
+
+                if snapshot_path is not None:
+                    save_snapshot(snapshot_path, version, schema)
+            else:
+                print(f"Reusing schema snapshot {snapshot_path}")
+
+            return {table: columns for table, columns in schema.items() if content == "all" or content in table}
+        except (Exception, mariadb.Error) as error:
+            print(f"Failed retrieving schema: {error}")
+
+
     def get_table_field_info(self, table):
         '''Retrieves the field info associated with a table.'''
         try:
@@ -82,4 +160,62 @@ class DbLib:
         '''Disconnect from the database'''
         if self.conn is not None:
             self.conn.close()
-            print("Successful disconnection")
\ No newline at end of file
+            print("Successful disconnection")
+
+
+def column_flags(column_type, nullable, key, extra):
+    '''Names the flags of an information_schema.COLUMNS row the way
+       mariadb.fieldinfo().flag names the same flags of a cursor column.
+    '''
+    flags = []
+
+    if nullable == "NO":
+        flags.append("NOT_NULL")
+
+    flags.extend({"PRI": ["PRIMARY_KEY"], "UNI": ["UNIQUE_KEY"], "MUL": ["MULTIPLE_KEY"]}.get(key, []))
+
+    if "unsigned" in column_type:
+        flags.append("UNSIGNED")
+
+    if "zerofill" in column_type:
+        flags.append("ZEROFILL")
+
+    if "auto_increment" in extra:
+        flags.append("AUTO_INCREMENT")
+
+    data_type = column_type.split("(")[0].split(" ")[0].lower()
+
+    if data_type in ("enum", "set"):
+        flags.append(data_type.upper())
+    elif data_type.endswith(("blob", "text")) or data_type == "json":
+        flags.append("BLOB")
+
+    return " | ".join(flags)
+
+
+def load_snapshot(path, version):
+    '''Returns the schema of a snapshot file taken at the given DDL version,
+       else None.
+    '''
+    if path is None:
+        return None
+
+    try:
+        with open(path) as in_file:
+            snapshot = json.load(in_file)
+
+        return snapshot["schema"] if snapshot["version"] == version else None
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_snapshot(path, version, schema):
+    '''Atomically writes a schema snapshot taken at a DDL version.'''
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    with os.fdopen(fd, "w") as out:
+        json.dump({"version": version, "schema": schema}, out, indent=4)
+
+    os.replace(tmp_path, path)
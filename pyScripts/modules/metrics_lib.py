@@ -0,0 +1,183 @@
+'''Library that records the wall time, result size and, where available,
+   driver-measured command stats of every DbLib call.
+
+   Recording is enabled by the env vars:
+       DBLIB_METRICS_LOG    path of a JSON-lines log with one record per call
+       DBLIB_METRICS_PROM   path of a Prometheus textfile with per-method totals
+       DBLIB_METRICS_SIZES  if set, also measure the JSON size of every result
+                            and the BSON size of every reply (a full encoding
+                            of each, so off by default)
+
+   The textfile holds the totals of one process: the worker processes of
+   DbLib.scan only write to the log. Failures to write either are reported
+   and never fail the call being recorded.
+'''
+import os
+import time
+import json
+import tempfile
+import functools
+import threading
+from datetime import datetime
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+
+
+def enabled():
+    return bool(os.environ.get("DBLIB_METRICS_LOG") or os.environ.get("DBLIB_METRICS_PROM"))
+
+
+def sizes_enabled():
+    return bool(os.environ.get("DBLIB_METRICS_SIZES"))
+
+
+def add_command_stats(seconds, reply_bytes):
+    '''Adds the driver-measured round-trip time and reply size of one command
+       to the innermost call being recorded in this thread, if any. Called by
+       conn_lib's command listener.
+    '''
+    stack = getattr(_local, "stack", None)
+
+    if stack:
+        stats = stack[-1]
+        stats["commands"] += 1
+        stats["round_trip_seconds"] += seconds
+        stats["reply_bytes"] += reply_bytes
+
+
+def instrument(lib_name):
+    '''Class decorator that records every public method call of a DbLib.'''
+    def decorate(cls):
+        for name, method in list(vars(cls).items()):
+            if callable(method) and not name.startswith("_"):
+                setattr(cls, name, _wrap(lib_name, method))
+
+        return cls
+
+    return decorate
+
+
+def _wrap(lib_name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not enabled():
+            return method(self, *args, **kwargs)
+
+        stack = _local.__dict__.setdefault("stack", [])
+        stats = {"commands": 0, "round_trip_seconds": 0.0, "reply_bytes": 0}
+        stack.append(stats)
+        start = time.monotonic()
+
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            stack.pop()
+
+            if stack:
+                for key in stats:
+                    stack[-1][key] += stats[key]
+
+        seconds = time.monotonic() - start
+        target = args[0] if args and isinstance(args[0], str) else None
+        record(lib_name, method.__name__, target, seconds, result, stats)
+
+        return result
+
+    return wrapper
+
+
+def result_size(result):
+    '''Returns the number of items and, if sizes are enabled, the JSON size
+       in bytes of a result, with None for what is not measured or cannot be
+       measured without consuming the result.
+    '''
+    items = len(result) if isinstance(result, (list, dict, set, tuple)) else None
+    measurable = items is not None or isinstance(result, (int, float, str, bool)) or result is None
+
+    if not measurable or not sizes_enabled():
+        return items, None
+
+    return items, len(json.dumps(result, default=str))
+
+
+def record(lib_name, method, target, seconds, result, stats):
+    '''Appends one call record to the log and updates the textfile totals.'''
+    items, size = result_size(result)
+    entry = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "pid": os.getpid(),
+        "lib": lib_name,
+        "method": method,
+        "collection": target,
+        "seconds": round(seconds, 6),
+        "ok": result is not False,
+        "items": items,
+        "result_bytes": size,
+        "commands": stats["commands"],
+        "round_trip_seconds": round(stats["round_trip_seconds"], 6),
+        "reply_bytes": stats["reply_bytes"]
+    }
+
+    with _lock:
+        key = (lib_name, method, target or "")
+        totals = _totals.setdefault(key, {"calls": 0, "failures": 0, "seconds": 0.0, "round_trip_seconds": 0.0,
+                                          "result_bytes": 0, "reply_bytes": 0})
+        totals["calls"] += 1
+        totals["failures"] += 0 if entry["ok"] else 1
+        totals["seconds"] += seconds
+        totals["round_trip_seconds"] += stats["round_trip_seconds"]
+        totals["result_bytes"] += size or 0
+        totals["reply_bytes"] += stats["reply_bytes"]
+
+        log_path = os.environ.get("DBLIB_METRICS_LOG")
+        prom_path = os.environ.get("DBLIB_METRICS_PROM")
+
+        try:
+            if log_path:
+                with open(log_path, "a") as log:
+                    log.write(json.dumps(entry) + "\n")
+
+            if prom_path:
+                write_textfile(prom_path)
+        except OSError as error:
+            print(f"Failed recording metrics of {method}: {error}")
+
+
+def write_textfile(path):
+    '''Atomically rewrites the Prometheus textfile with the totals so far.'''
+    lines = []
+
+    for metric, help_text in [
+        ("calls", "Number of DbLib calls"),
+        ("failures", "Number of failed DbLib calls"),
+        ("seconds", "Wall time spent in DbLib calls"),
+        ("round_trip_seconds", "Driver-measured round-trip time of the commands of DbLib calls"),
+        ("result_bytes", "JSON size of DbLib call results, if measured"),
+        ("reply_bytes", "BSON size of server replies to DbLib calls, if measured")
+    ]:
+        name = f"dblib_{metric}_total"
+        lines.append(f"# HELP {name} {help_text}.")
+        lines.append(f"# TYPE {name} counter")
+
+        for (lib_name, method, target), totals in sorted(_totals.items()):
+            labels = f'lib="{lib_name}",method="{method}",collection="{target}"'
+            lines.append(f"{name}{{{labels}}} {totals[metric]}")
+
+    lines.append("# HELP dblib_last_record_timestamp_seconds Time of the last recorded DbLib call.")
+    lines.append("# TYPE dblib_last_record_timestamp_seconds gauge")
+    lines.append(f"dblib_last_record_timestamp_seconds {time.time()}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w") as out:
+            out.write("\n".join(lines) + "\n")
+
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        raise
@@ -3,34 +3,328 @@
 import sys
 import os
 import pprint
+import time
+import random
+import calendar
+import datetime
+import re
+import fnmatch
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import bson
 import pymongo
-from bson.code import Code
+from bson import json_util
+from bson.objectid import ObjectId
+from modules import conn_lib, metrics_lib
+from modules.sketch_lib import HyperLogLog
+
+
+def key_paths_expr(field, prefix, depth):
+    '''Builds an aggregation expression that expands a document into an array
+       of dotted key paths, descending into sub-documents up to a given depth.
+    '''
+    nested = []
+
+    if depth > 1:
+        nested = {"$cond": [
+            {"$eq": [{"$type": "$$this.v"}, "object"]},
+            {"$let": {
+                "vars": {
+                    "prefix": {"$concat": [prefix, "$$this.k", "."]},
+                    "sub": "$$this.v"
+                },
+                "in": key_paths_expr("$$sub", "$$prefix", depth - 1)
+            }},
+            []
+        ]}
+
+    return {"$reduce": {
+        "input": {"$objectToArray": field},
+        "initialValue": [],
+        "in": {"$concatArrays": [
+            "$$value",
+            [{"$concat": [prefix, "$$this.k"]}],
+            nested
+        ]}
+    }}
+
+
+## Buckets documents by the "yyyy/mm/dd" prefix of header.DicomFilePath and the
+## "yyyymmdd" StudyDate in a single grouped pass
+DAY_BUCKET_STAGES = [
+    {"$project": {
+        "_id": 0,
+        "path": {"$substrBytes": [{"$ifNull": ["$header.DicomFilePath", ""]}, 0, 10]},
+        "study": {"$substrBytes": [{"$ifNull": ["$StudyDate", ""]}, 0, 8]}
+    }},
+    {"$facet": {
+        "path": [{"$group": {"_id": "$path", "count": {"$sum": 1}}}],
+        "study": [{"$group": {"_id": "$study", "count": {"$sum": 1}}}]
+    }}
+]
+
+
+## Indexes the DbLib queries rely on, as (field, direction) keys
+PATH_INDEX = [("header.DicomFilePath", pymongo.ASCENDING)]
+STUDY_INDEX = [("StudyDate", pymongo.ASCENDING)]
+MODALITY_INDEX = [("Modality", pymongo.ASCENDING)]
+STRATUM_INDEX = [("Modality", pymongo.ASCENDING), ("StudyDate", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
+
+
+def stratum_filter(modality, segment):
+    '''Filter of the documents of one modality within a StudyDate (and _id)
+       segment, as read by the stratified sampler.
+    '''
+    return dict(segment, Modality=modality)
+
+
+def path_filter(paths):
+    '''Filter of the documents with any of the given DicomFilePaths.'''
+    return {"header.DicomFilePath": {"$in": list(paths)}}
+
+
+def days_filter(path_days=(), study_days=()):
+    '''Filter of the documents of the given "YYYY-MM-DD" DicomFilePath and
+       StudyDate days, matched by anchored prefix, or None without any day.
+    '''
+    match = []
+
+    if path_days:
+        match.append({"header.DicomFilePath": {"$in": [re.compile("^" + re.escape(day.replace("-", "/")))
+                                                       for day in path_days]}})
+
+    if study_days:
+        match.append({"StudyDate": {"$in": [re.compile("^" + re.escape(day.replace("-", "")))
+                                            for day in study_days]}})
+
+    return {"$or": match} if match else None
+
+
+def modality_query(modality="all"):
+    '''Pipeline counting documents by modality, or of a single modality.'''
+    if modality == "all":
+        return [
+            {"$group": {"_id": "$Modality", "count": {"$sum": 1}}}
+        ]
+
+    return [
+        {"$match": {"Modality": modality}},
+        {"$group": {"_id": modality, "count": {"$sum": 1}}}
+    ]
+
+
+def unique_vals_query(tag):
+    '''Pipeline counting the documents of every value of a tag by year.'''
+    return [
+        {"$group": {
+            "_id": {
+                "year": {
+                    "$substr": ["$StudyDate", 0, 4]
+                },
+                f"{tag}": f"${tag}"
+            },
+            "total": {"$sum": 1}
+        }},
+        {"$group": {
+            "_id": "$_id.year",
+            f"{tag}s": {
+                "$push": {
+                    "term": f"$_id.{tag}",
+                    "total": "$total"
+                }
+            }
+        }}
+    ]
+
+
+def init_day_counts(min_year, max_year, init=list):
+    '''Returns a {year: {month: {day: init()}}} tree covering every day
+       between min_year and max_year inclusive.
+    '''
+    counts = {}
+
+    for year in range(min_year, max_year + 1):
+        counts[str(year)] = {}
+
+        for month in range(1, 13):
+            days = calendar.monthrange(year, month)[1]
+            counts[str(year)][f"{month:02d}"] = {f"{day:02d}": init() for day in range(1, days + 1)}
+
+    return counts
+
+
+def patch_day_counts(counts, recounts):
+    '''Overwrites the [DicomFilePath count, StudyDate count] days of a
+       {year: {month: {day: [path, study]}}} tree with the "YYYY-MM-DD" days
+       of a count_days result, and returns the tree. Days outside the tree
+       are ignored.
+    '''
+    for column, metric in enumerate(["path", "study"]):
+        for date, count in recounts[metric].items():
+            year, month, day = date.split("-")
+
+            if day in counts.get(year, {}).get(month, {}):
+                counts[year][month][day][column] = count
+
+    return counts
+
+
+def scan_partition(config, db_name, collection, query, projection, bounds, map_func, reduce_func, initial):
+    '''Scans one _id range of a collection in a worker process, folding
+       map_func(doc) into initial with reduce_func. Workers only log their
+       metrics, leaving the textfile to the parent process.
+    '''
+    os.environ.pop("DBLIB_METRICS_PROM", None)
+    lib = DbLib(config)
+    lib.switch_db(db_name)
+    lower, upper = bounds
+    id_range = {}
+
+    if lower is not None:
+        id_range["$gte"] = lower
+
+    if upper is not None:
+        id_range["$lt"] = upper
+
+    result = initial
+    match = dict(query, _id=id_range) if id_range else dict(query)
+
+    for doc in lib.db[collection].find(match, projection, batch_size=lib.settings["batch_size"]):
+        result = reduce_func(result, map_func(doc))
+
+    lib.disconnect()
+    return result
+
+
+class QueryCache:
+    def __init__(self, path, ttl=6 * 3600, max_bytes=512 * 1024 ** 2, refresh=False):
+        '''On-disk cache of query results, one file per key under path.
+           Entries older than ttl seconds are ignored, the least recently used
+           entries are evicted once the cache grows beyond max_bytes, and with
+           refresh every lookup misses so that results are recomputed.
+        '''
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+
+        os.makedirs(path, exist_ok=True)
+
+
+    @staticmethod
+    def key(db_name, collection, query, fingerprint):
+        '''Hashes the BSON encoding of the query, which is canonical for a
+           given pipeline, with the database, collection and fingerprint.
+        '''
+        canonical = bson.encode({
+            "db": db_name,
+            "collection": collection,
+            "query": query,
+            "fingerprint": fingerprint
+        })
+        return hashlib.sha256(canonical).hexdigest()
+
+
+    def get(self, key):
+        '''Returns (True, result) on a fresh hit, else (False, None).'''
+        filename = os.path.join(self.path, f"{key}.json")
+
+        if self.refresh:
+            return False, None
+
+        try:
+            with open(filename) as in_file:
+                entry = json_util.loads(in_file.read())
+
+            if time.time() - entry["created"] > self.ttl:
+                return False, None
+
+            os.utime(filename)  # Mark as recently used
+            return True, entry["result"]
+        except (OSError, ValueError, KeyError):
+            return False, None
+
+
+    def put(self, key, result):
+        '''Atomically stores a result and evicts old entries if needed.'''
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+
+        with os.fdopen(fd, "w") as out:
+            out.write(json_util.dumps({"created": time.time(), "result": result}))
+
+        os.replace(tmp_path, os.path.join(self.path, f"{key}.json"))
+        self.evict()
+
+
+    def evict(self):
+        '''Removes the least recently used entries until the cache fits in
+           max_bytes.
+        '''
+        entries = []
 
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
 
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+
+
+@metrics_lib.instrument("mongo")
 class DbLib:
-    def __init__(self):
+    def __init__(self, config=None, read_preference=None):
+        '''Connects with the settings of the config file (see conn_lib), with
+           the read preference overridden if given, e.g. "secondaryPreferred"
+           for read-only scripts that can tolerate slightly stale data.
+        '''
         self.client = None
         self.db = None
+        self.config = config
+        self.settings = conn_lib.load_settings(config)
+        self.cache = None
+
+        if read_preference is not None:
+            self.settings["read_preference"] = read_preference
 
         self.connect()
 
     def connect(self):
         '''Connect to MongoDB database based on credentials available via
-           env vars.
+           env vars and tuning options from the config file (see conn_lib).
+           DbLib instances with the same settings share one client.
         '''
         try:
-            self.client = pymongo.MongoClient(
-                os.environ.get("HOST"),
-                username=os.environ.get("USER"),
-                password=os.environ.get("PASS"),
-                authSource=os.environ.get("AUTHDB")
-            )
+            self.client = conn_lib.get_client(self.settings)
             print("Successful connection")
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed connection: {error}")
             sys.exit(1)
 
 
+    def enable_cache(self, path, ttl=6 * 3600, max_bytes=512 * 1024 ** 2, refresh=False):
+        '''Serves count_images, count_by_modality, list_unique_vals and
+           list_tags from an on-disk QueryCache while the collection is
+           unchanged (same document count and max _id).
+        '''
+        self.cache = QueryCache(path, ttl, max_bytes, refresh)
+
+
     def switch_db(self, db_name):
         '''Connects to specified database.'''
         try:
@@ -41,6 +335,42 @@ class DbLib:
             sys.exit(1)
 
 
+    def _aggregate(self, collection, query, **kwargs):
+        '''Runs an aggregation on a given collection with the configured
+           cursor batch size.
+        '''
+        kwargs.setdefault("batchSize", self.settings["batch_size"])
+        return self.db[collection].aggregate(query, **kwargs)
+
+
+    def _cached(self, collection, query, fetch):
+        '''Returns the cached result of a query if the cache is enabled and
+           holds a fresh one, else runs fetch() and caches its result. A
+           failure to write the cache is reported but does not fail the query.
+        '''
+        if self.cache is None:
+            return fetch()
+
+        last = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+        fingerprint = [self.db[collection].estimated_document_count(), last["_id"] if last else None]
+        key = self.cache.key(self.db.name, collection, query, fingerprint)
+
+        hit, result = self.cache.get(key)
+
+        if hit:
+            print(f"Served cached result for {collection}")
+            return result
+
+        result = fetch()
+
+        try:
+            self.cache.put(key, result)
+        except OSError as error:
+            print(f"Failed caching result for {collection}: {error}")
+
+        return result
+
+
     def list_collections(self):
         '''Lists collections in current database.'''
         try:
@@ -52,6 +382,104 @@ class DbLib:
             return False
 
 
+    def fan_out(self, method, *args, pattern="image_*", exclude=(), workers=4, timeout=None, **kwargs):
+        '''Runs a DbLib method (given by name, e.g. "count_images") over every
+           collection matching a glob-style pattern, but none of the exclude
+           patterns, on a bounded thread pool and returns the results merged
+           as {collection: result}.
+           The timeout, in seconds, applies to each collection separately;
+           collections that fail or time out map to False.
+        '''
+        func = getattr(self, method) if isinstance(method, str) else method
+        collections = [collection for collection in fnmatch.filter(self.list_collections() or [], pattern)
+                       if not any(fnmatch.fnmatch(collection, excluded) for excluded in exclude)]
+
+        def run(collection):
+            if timeout is None:
+                return func(collection, *args, **kwargs)
+
+            with pymongo.timeout(timeout):
+                return func(collection, *args, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(collections, pool.map(run, collections)))
+
+        print(f"Successfully ran {getattr(func, '__name__', method)} over {len(collections)} collection(s) matching {pattern}")
+        return results
+
+
+    def scan(self, collection, map_func, reduce_func, initial=None, projection=None, query=None,
+             partitions=None, workers=None, split="time"):
+        '''Scans a collection client-side on a process pool and returns the
+           reduced result. The collection is split into disjoint _id ranges,
+           either evenly over the ObjectId timestamps of its first and last
+           documents (split="time") or at $bucketAuto boundaries (split="bucket",
+           which costs a pass over the _id index but balances the ranges).
+           Each range is scanned with the projection in its own process,
+           folding map_func(doc) into initial with reduce_func, and the
+           partial results are combined with reduce_func too, so it must be
+           associative. map_func and reduce_func must be picklable (defined
+           at module level). Empty ranges, whose partial result is a None
+           initial, are skipped when combining.
+        '''
+        workers = workers or os.cpu_count()
+        partitions = partitions or workers * 4
+        query = query or {}
+
+        try:
+            bounds = self._partition_bounds(collection, partitions, split)
+            context = multiprocessing.get_context("spawn")  # Clients must not be shared across fork
+
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = [
+                    pool.submit(scan_partition, self.config, self.db.name, collection, query, projection,
+                                bound, map_func, reduce_func, initial)
+                    for bound in bounds
+                ]
+                result = initial
+
+                for future in futures:
+                    partial = future.result()
+
+                    if partial is not None:
+                        result = partial if result is None else reduce_func(result, partial)
+
+            print(f"Successfully scanned {collection} in {len(bounds)} partition(s)")
+            return result
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed scanning {collection}: {error}")
+            return False
+
+
+    def _partition_bounds(self, collection, partitions, split):
+        '''Returns the (lower, upper) _id bounds of the partitions of a
+           collection, the first and last being open-ended.
+        '''
+        if split == "bucket":
+            query = [{"$bucketAuto": {"groupBy": "$_id", "buckets": partitions}}]
+            edges = [bucket["_id"]["min"] for bucket in self._aggregate(collection, query, allowDiskUse=True)][1:]
+        else:
+            first = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.ASCENDING)])
+            last = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+
+            if first is None:
+                return [(None, None)]
+
+            if not isinstance(first["_id"], ObjectId) or not isinstance(last["_id"], ObjectId):
+                return self._partition_bounds(collection, partitions, "bucket")
+
+            start = first["_id"].generation_time.timestamp()
+            end = last["_id"].generation_time.timestamp() + 1
+            step = (end - start) / partitions
+            edges = [
+                ObjectId.from_datetime(datetime.datetime.fromtimestamp(start + step * n, datetime.timezone.utc))
+                for n in range(1, partitions)
+            ]
+
+        edges = sorted(set(edges))
+        return list(zip([None] + edges, edges + [None]))
+
+
     def create_index(self, collection, index, uniq=False):
         '''Creates an index in a given collection.'''
         try:
@@ -62,6 +490,24 @@ class DbLib:
             return False
 
         
+    def ensure_index(self, collection, keys):
+        '''Creates an index on a list of (field, direction) keys in a given
+           collection unless an index starting with those keys exists.
+           Returns True once such an index is in place.
+        '''
+        try:
+            for info in self.db[collection].index_information().values():
+                if list(info["key"])[:len(keys)] == list(keys):
+                    return True
+
+            self.db[collection].create_index(keys)
+            print(f"Successfully created an index on {', '.join(field for field, _ in keys)} in {collection}")
+            return True
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed ensuring an index on {', '.join(field for field, _ in keys)} in {collection}: {error}")
+            return False
+
+
     def list_indexes(self, collection):
         '''Lists indexes in a given collection.'''
         try:
@@ -84,23 +530,95 @@ class DbLib:
             return False
 
 
-    def sample(self, collection, number):
+    def sample(self, collection, number, lazy=False, stratify=False, min_year=2010, max_year=2018, workers=4):
         '''Finds and returns a given number of sample documents in a
-           given collection.
+           given collection. If lazy, the cursor is returned unconsumed so
+           it can be streamed with file_lib.stream_dump.
+           If stratify, up to number documents are returned for each year
+           and modality instead, read with bounded index range lookups from
+           random starting points rather than a collection-wide $sample. The
+           strata are sampled concurrently on a pool of workers.
         '''
+        if stratify:
+            return self._stratified_sample(collection, number, lazy, min_year, max_year, workers)
+
         query = [
             {"$sample": {"size": number}}
         ]
 
         try:
-            samples = self.db[collection].aggregate(query)
+            samples = self._aggregate(collection, query)
             print(f"Successfully extracted {number} sample document(s) from collection {collection}")
-            return list(samples)
+            return samples if lazy else list(samples)
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed extracting {number} sample documens from collection {collection}: {error}")
             return False
 
 
+    def _stratified_sample(self, collection, quota, lazy, min_year, max_year, workers):
+        '''Samples every (year, modality) stratum of a collection with bounded
+           index range reads on (Modality, StudyDate, _id), created if missing.
+           Each stratum is read from a random lower bound (a random StudyDate
+           day and, within it, a random _id) with a limit of the quota, then
+           topped up by wrapping around to the start of the year, so the
+           picks are distinct and only quota documents are read per stratum.
+        '''
+        order = [(field, pymongo.ASCENDING) for field, _ in STRATUM_INDEX]
+        first = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.ASCENDING)])
+        last = self.db[collection].find_one({}, {"_id": 1}, sort=[("_id", pymongo.DESCENDING)])
+        object_ids = first is not None and isinstance(first["_id"], ObjectId) and isinstance(last["_id"], ObjectId)
+
+        def random_id():
+            if not object_ids:
+                return None
+
+            lower = first["_id"].generation_time.timestamp()
+            upper = last["_id"].generation_time.timestamp()
+            return ObjectId.from_datetime(datetime.datetime.fromtimestamp(random.uniform(lower, upper), datetime.timezone.utc))
+
+        def pick(stratum):
+            year, modality = stratum
+            start = datetime.date(year, 1, 1)
+            offset = random.randrange((datetime.date(year + 1, 1, 1) - start).days)
+            day = (start + datetime.timedelta(days=offset)).strftime("%Y%m%d")
+            next_day = (start + datetime.timedelta(days=offset + 1)).strftime("%Y%m%d")
+            bound = random_id()
+
+            segments = [
+                {"StudyDate": {"$gte": day, "$lt": next_day}},
+                {"StudyDate": {"$gte": next_day, "$lt": str(year + 1)}},
+                {"StudyDate": {"$gte": str(year), "$lt": day}}
+            ]
+
+            if bound is not None:  # Start at a random document of the day, wrap around to its earlier ones
+                segments[0]["_id"] = {"$gte": bound}
+                segments.append({"StudyDate": {"$gte": day, "$lt": next_day}, "_id": {"$lt": bound}})
+
+            picked = []
+
+            for segment in segments:
+                if len(picked) >= quota:
+                    break
+
+                picked.extend(self.db[collection].find(stratum_filter(modality, segment)).sort(order).limit(quota - len(picked)))
+
+            return picked
+
+        try:
+            self.ensure_index(collection, STRATUM_INDEX)
+            modalities = self.db[collection].distinct("Modality")
+            strata = [(year, modality) for year in range(min_year, max_year + 1) for modality in modalities]
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                samples = [doc for docs in pool.map(pick, strata) for doc in docs]
+
+            print(f"Successfully extracted {len(samples)} sample document(s) from {len(strata)} strata of collection {collection}")
+            return iter(samples) if lazy else samples
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed extracting stratified samples from collection {collection}: {error}")
+            return False
+
+
     def count_documents(self, collection):
         '''Returns a count of the documents in a given collection.'''
         try:
@@ -117,20 +635,12 @@ class DbLib:
            If a modality name is specified, only the count for that modality
            will be returned, else, counts for all modalities will be returned.
         '''
-        if modality == "all":
-            query = [
-                {"$group": {"_id": "$Modality", "count": {"$sum": 1}}}
-            ]
-        else:
-            query = [
-                {"$match": {"Modality": modality}},
-                {"$group": {"_id": modality, "count": {"$sum": 1}}}
-            ]
+        query = modality_query(modality)
 
         try:
-            count = self.db[collection].aggregate(query)
+            count = self._cached(collection, query, lambda: list(self._aggregate(collection, query)))
             print(f"Successfully counted documents in {collection}")
-            return list(count)
+            return count
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed counting documents in {collection}: {error}")
             return False
@@ -160,9 +670,10 @@ class DbLib:
             ]
 
         try:
-            count = self.db[collection].aggregate(query, allowDiskUse=True)
+            count = self._cached(collection, query,
+                                 lambda: list(self._aggregate(collection, query, allowDiskUse=True)))
             print(f"Successfully counted images in {collection}")
-            return list(count)
+            return count
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed counting images in {collection}: {error}")
             return False
@@ -181,7 +692,7 @@ class DbLib:
         ]
 
         try:
-            count = self.db[collection].aggregate(query, allowDiskUse=True)
+            count = self._aggregate(collection, query, allowDiskUse=True)
             print(f"Successfully counted images in {collection}")
             return list(count)
         except (Exception, pymongo.errors.PyMongoError) as error:
@@ -189,75 +700,209 @@ class DbLib:
             return False
 
 
-    def list_tags(self, collection):
-        '''Returns a list of distinct tags in a given collection.'''
-        map_query = Code("function() {"
-                         "    for (var key in this) {"
-                         "        emit(key, null);"
-                         "    }"
-                         "}"
-        )
+    def count_by_day(self, collection, min_year=2010, max_year=2018):
+        '''Returns the number of documents in a given collection per day, as
+           {year: {month: {day: [DicomFilePath count, StudyDate count]}}}.
+           Both the "yyyy/mm/dd" prefix of header.DicomFilePath and the
+           "yyyymmdd" StudyDate are bucketed in a single grouped pass.
+        '''
+        query = DAY_BUCKET_STAGES
+        counts = init_day_counts(min_year, max_year, lambda: [0, 0])
+
+        try:
+            result = next(self._aggregate(collection, query, allowDiskUse=True))
+
+            for bucket in result["path"]:
+                year, month, day = bucket["_id"][0:4], bucket["_id"][5:7], bucket["_id"][8:10]
+
+                if day in counts.get(year, {}).get(month, {}):
+                    counts[year][month][day][0] += bucket["count"]
+
+            for bucket in result["study"]:
+                year, month, day = bucket["_id"][0:4], bucket["_id"][4:6], bucket["_id"][6:8]
+
+                if day in counts.get(year, {}).get(month, {}):
+                    counts[year][month][day][1] += bucket["count"]
+
+            print(f"Successfully counted documents by day in {collection}")
+            return counts
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed counting documents by day in {collection}: {error}")
+            return False
+
+
+    def count_days(self, collection, path_days=(), study_days=()):
+        '''Returns {"path": {day: count}, "study": {day: count}} for the given
+           "YYYY-MM-DD" DicomFilePath and StudyDate days only, as count_by_day
+           would count them. Only the documents of those days are matched, by
+           anchored prefix, so a handful of days costs a handful of index
+           range scans rather than a pass over the collection.
+        '''
+        counts = {"path": dict.fromkeys(path_days, 0), "study": dict.fromkeys(study_days, 0)}
+        match = days_filter(path_days, study_days)
+
+        if match is None:
+            return counts
+
+        query = [{"$match": match}] + DAY_BUCKET_STAGES
+
+        try:
+            result = next(self._aggregate(collection, query, allowDiskUse=True))
+
+            for bucket in result["path"]:
+                date = "-".join([bucket["_id"][0:4], bucket["_id"][5:7], bucket["_id"][8:10]])
+
+                if date in counts["path"]:
+                    counts["path"][date] += bucket["count"]
 
-        reduce_query = Code("function(key, value) {"
-                            "    return null;"
-                            "}"
-        )
+            for bucket in result["study"]:
+                date = "-".join([bucket["_id"][0:4], bucket["_id"][4:6], bucket["_id"][6:8]])
 
-        output = collection + "_keys"
+                if date in counts["study"]:
+                    counts["study"][date] += bucket["count"]
+
+            print(f"Successfully recounted {len(path_days)} DicomFilePath and {len(study_days)} StudyDate day(s) in {collection}")
+            return counts
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed recounting days in {collection}: {error}")
+            return False
+
+
+    def count_unique_studies_by_day(self, collection, min_year=2010, max_year=2018, approximate=False, precision=12):
+        '''Returns the number of unique StudyInstanceUIDs in a given collection
+           per DicomFilePath day, as {year: {month: {day: count}}}, from one
+           grouped pass. If approximate, each day holds instead a HyperLogLog
+           sketch of the UIDs, which can be merged across collections. The
+           UIDs are then hashed and bucketed on the server, which only returns
+           the smallest hash of each (day, register), so neither the UIDs nor
+           the documents cross the wire. Requires MongoDB 7.0
+           ($toHashedIndexKey); sketches are only mergeable with sketches
+           built the same way.
+        '''
+        match = {"StudyInstanceUID": {"$exists": True}}
+        day_expr = {"$substrBytes": [{"$ifNull": ["$header.DicomFilePath", ""]}, 0, 10]}
 
         try:
-            result = self.db[collection].map_reduce(map_query, reduce_query, out=output)
-            print(f"Successfully retrieved a list of tags from collection {collection}")
+            if approximate:
+                query = [
+                    {"$match": match},
+                    {"$project": {"_id": 0, "day": day_expr, "hash": {"$toHashedIndexKey": "$StudyInstanceUID"}}},
+                    {"$group": {
+                        "_id": {"day": "$day", "index": {"$bitAnd": ["$hash", bson.Int64((1 << precision) - 1)]}},
+                        "rest": {"$min": {"$bitAnd": ["$hash", bson.Int64((1 << 63) - 1)]}}
+                    }}
+                ]
+                counts = init_day_counts(min_year, max_year, lambda: HyperLogLog(precision))
+
+                for bucket in self._aggregate(collection, query, allowDiskUse=True):
+                    day_key = bucket["_id"]["day"]
+                    year, month, day = day_key[0:4], day_key[5:7], day_key[8:10]
+
+                    if day in counts.get(year, {}).get(month, {}):
+                        counts[year][month][day].add_hash(bucket["_id"]["index"], bucket["rest"])
+            else:
+                query = [
+                    {"$match": match},
+                    {"$group": {"_id": {"day": day_expr, "uid": "$StudyInstanceUID"}}},
+                    {"$group": {"_id": "$_id.day", "count": {"$sum": 1}}}
+                ]
+                counts = init_day_counts(min_year, max_year, int)
+
+                for bucket in self._aggregate(collection, query, allowDiskUse=True):
+                    year, month, day = bucket["_id"][0:4], bucket["_id"][5:7], bucket["_id"][8:10]
+
+                    if day in counts.get(year, {}).get(month, {}):
+                        counts[year][month][day] += bucket["count"]
+
+            print(f"Successfully counted unique studies by day in {collection}")
+            return counts
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed counting unique studies by day in {collection}: {error}")
+            return False
 
-            try:
-                distinct = result.distinct("_id")
-                print(f"Successfully retrieved a list of distinct tags from collection {collection}")
-                return distinct
-            except (Exception, pymongo.errors.PyMongoError) as error:
-                print(f"Failed retrieving a list of distinct tags from {collection}: {error}")
-                return False
+
+    def list_tags(self, collection, depth=2, sample_size=None, patience=3, max_batches=100):
+        '''Returns a sorted list of distinct tags in a given collection.
+           Keys are discovered server-side with $objectToArray and grouped,
+           descending into nested sub-documents (e.g. header.*) up to the
+           given depth. Nothing is written to the server.
+           If a sample size is specified, batches of that many sampled
+           documents are inspected until no new keys have appeared for
+           a given number of consecutive batches (patience) or max_batches
+           has been reached.
+        '''
+        def discover():
+            tags = set()
+
+            if sample_size is None:
+                tags.update(self._discover_keys(collection, depth))
+            else:
+                stale = 0
+
+                for _ in range(max_batches):
+                    new_tags = self._discover_keys(collection, depth, sample_size) - tags
+                    tags.update(new_tags)
+                    stale = 0 if new_tags else stale + 1
+
+                    if stale >= patience:
+                        break
+
+            return sorted(tags)
+
+        query = [{"listTags": {"depth": depth, "sample_size": sample_size,
+                               "patience": patience, "max_batches": max_batches}}]
+
+        try:
+            tags = self._cached(collection, query, discover)
+            print(f"Successfully retrieved a list of distinct tags from collection {collection}")
+            return tags
         except (Exception, pymongo.errors.PyMongoError) as error:
-            print(f"Failed retrieving a list of tags from {collection}: {error}")
+            print(f"Failed retrieving a list of distinct tags from {collection}: {error}")
             return False
 
 
-    def list_unique_vals(self, collection, tag):
-        '''Returns a list of distinct values for a given tag in a given collection
-           and the number of documents with that value by year.
+    def _discover_keys(self, collection, depth, sample_size=None):
+        '''Runs the key discovery aggregation over a given collection, or over
+           a random sample of it, and returns the set of dotted key paths.
         '''
         query = [
-            {"$group": {
-                "_id": {
-                    "year": {
-                        "$substr": ["$StudyDate", 0, 4]
-                    },
-                    f"{tag}": f"${tag}"
-                },
-                "total": {"$sum": 1}
-            }},
-            {"$group": {
-                "_id": "$_id.year",
-                f"{tag}s": {
-                    "$push": {
-                        "term": f"$_id.{tag}",
-                        "total": "$total"
-                    }
-                }
-            }}
+            {"$project": {"_id": 0, "keys": key_paths_expr("$$ROOT", "", depth)}},
+            {"$unwind": "$keys"},
+            {"$group": {"_id": "$keys"}}
         ]
 
+        if sample_size is not None:
+            query.insert(0, {"$sample": {"size": sample_size}})
+
+        result = self._aggregate(collection, query, allowDiskUse=True)
+        return {doc["_id"] for doc in result}
+
+
+    def list_unique_vals(self, collection, tag, lazy=False):
+        '''Returns a list of distinct values for a given tag in a given collection
+           and the number of documents with that value by year. If lazy, the
+           cursor is returned unconsumed.
+        '''
+        query = unique_vals_query(tag)
+
         try:
-            count = self.db[collection].aggregate(query, allowDiskUse=True)
+            if lazy:
+                count = self._aggregate(collection, query, allowDiskUse=True)
+            else:
+                count = self._cached(collection, query,
+                                     lambda: list(self._aggregate(collection, query, allowDiskUse=True)))
+
             print(f"Successfully extracted distinct list of {tag} from {collection}")
-            return list(count)
+            return count
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed extracting distinct list of {tag} from {collection}: {error}")
             return False
 
 
-    def list_null_vals(self, collection, tag):
+    def list_null_vals(self, collection, tag, lazy=False):
         '''Returns a list of distinct values for a given tag in a given collection
-           and the number of documents with that value by year.
+           and the number of documents with that value by year. If lazy, the
+           cursor is returned unconsumed.
         '''
         query = [
             {"$group": {
@@ -275,9 +920,9 @@ class DbLib:
         ]
 
         try:
-            count = self.db[collection].aggregate(query, allowDiskUse=True)
+            count = self._aggregate(collection, query, allowDiskUse=True)
             print(f"Successfully extracted distinct list of {tag} from {collection}")
-            return list(count)
+            return count if lazy else list(count)
         except (Exception, pymongo.errors.PyMongoError) as error:
             print(f"Failed extracting distinct list of {tag} from {collection}: {error}")
             return False
@@ -286,5 +931,6 @@ class DbLib:
     def disconnect(self):
         '''Disconnect from the database'''
         if self.client is not None:
-            self.client.close()
+            conn_lib.release_client(self.client)
+            self.client = None
             print("Successful disconnection")
\ No newline at end of file
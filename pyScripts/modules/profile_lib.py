@@ -0,0 +1,120 @@
+'''Library class that profiles the presence and most common values of a list
+   of tags in one scan per collection.
+'''
+import os
+import pymongo
+import modules.file_lib as flib
+from modules.sketch_lib import SpaceSaving
+
+
+class TagProfiler:
+    def __init__(self, lib, tags, k=20):
+        '''Wraps a connected mongo_lib.DbLib. For every tag, year and modality
+           the documents with and without the tag are counted and the values
+           are kept in a SpaceSaving sketch of k counters, so memory is bounded
+           whatever the cardinality of the tag.
+        '''
+        self.lib = lib
+        self.tags = tags
+        self.k = k
+
+
+    def run(self, pattern="image_*", workers=4):
+        '''Profiles every collection matching a pattern concurrently and merges
+           the profiles.
+        '''
+        profiles = self.lib.fan_out(self.profile, pattern=pattern, workers=workers)
+        merged = {}
+
+        for profile in profiles.values():
+            if profile:
+                merge_profiles(merged, profile)
+
+        return merged
+
+
+    def profile(self, collection):
+        '''Aggregates a collection once and returns
+           {tag: {modality: {year: {"total_count", "tag_count", "values"}}}},
+           with "values" holding the SpaceSaving sketch of the tag. The
+           server groups the documents by tag, modality, year and value, so
+           only one count per distinct value crosses the wire and is added
+           to the sketches, weighted by its count.
+        '''
+        query = [
+            {"$project": {
+                "_id": 0,
+                "modality": "$Modality",
+                "year": {"$substrCP": [{"$toString": {"$ifNull": ["$StudyDate", ""]}}, 0, 4]},
+                "tags": [
+                    {"tag": tag, "value": f"${tag}", "found": {"$ne": [{"$type": f"${tag}"}, "missing"]}}
+                    for tag in self.tags
+                ]
+            }},
+            {"$unwind": "$tags"},
+            {"$group": {
+                "_id": {"tag": "$tags.tag", "modality": "$modality", "year": "$year",
+                        "found": "$tags.found", "value": "$tags.value"},
+                "count": {"$sum": 1}
+            }}
+        ]
+        profile = {tag: {} for tag in self.tags}
+
+        try:
+            for group in self.lib.db[collection].aggregate(query, allowDiskUse=True,
+                                                           batchSize=self.lib.settings["batch_size"]):
+                key = group["_id"]
+                years = profile[key["tag"]].setdefault(str(key.get("modality")), {})
+                stats = years.get(key["year"])
+
+                if stats is None:
+                    stats = years[key["year"]] = {"total_count": 0, "tag_count": 0, "values": SpaceSaving(self.k)}
+
+                stats["total_count"] += group["count"]
+
+                if key["found"]:
+                    stats["tag_count"] += group["count"]
+                    stats["values"].add(str(key.get("value")), group["count"])
+
+            print(f"Successfully profiled {len(self.tags)} tag(s) in {collection}")
+            return profile
+        except (Exception, pymongo.errors.PyMongoError) as error:
+            print(f"Failed profiling tags in {collection}: {error}")
+            return False
+
+
+def merge_profiles(merged, profile):
+    '''Merges one profile into another in place.'''
+    for tag, modalities in profile.items():
+        for modality, years in modalities.items():
+            for year, stats in years.items():
+                target = merged.setdefault(tag, {}).setdefault(modality, {}).get(year)
+
+                if target is None:
+                    merged[tag][modality][year] = stats
+                else:
+                    target["total_count"] += stats["total_count"]
+                    target["tag_count"] += stats["tag_count"]
+                    target["values"].merge(stats["values"])
+
+    return merged
+
+
+def write_reports(profile, directory, top=5):
+    '''Writes one <tag>_<modality>.json file per tag and modality in the
+       {year: {month: {day: {"total_count", "tag_count", "values"}}}} shape
+       read by analysis/tagAnalysis/generate_tag_report.py. Counts are kept
+       per year, so each year holds a single "all"/"all" bucket.
+    '''
+    for tag, modalities in profile.items():
+        for modality, years in modalities.items():
+            counts = {
+                year: {"all": {"all": {
+                    "total_count": stats["total_count"],
+                    "tag_count": stats["tag_count"],
+                    "values": stats["values"].top(top)
+                }}}
+                for year, stats in sorted(years.items())
+            }
+
+            flib.json_dump(counts, os.path.join(directory, f"{tag}_{modality}.json"))
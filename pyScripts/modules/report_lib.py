@@ -0,0 +1,255 @@
+'''Library that builds the count reports as tables held in memory and
+   renders each report as Markdown, CSV or HTML, written atomically.
+'''
+import io
+import os
+import re
+import csv
+import html
+from datetime import datetime
+from modules import cube_lib
+
+## Output formats by file extension
+FORMATS = ["md", "csv", "html"]
+
+
+class Table:
+    def __init__(self, title, headers, group=0, note=None):
+        '''Table of rows of cells. In Markdown and HTML the first group cells of
+           a row are left blank when they repeat the row above (e.g. the year
+           of every month after the first), while CSV keeps every cell.
+        '''
+        self.title = title
+        self.headers = headers
+        self.group = group
+        self.note = note
+        self.rows = []
+
+
+    def add_row(self, *cells):
+        self.rows.append([str(cell) for cell in cells])
+
+
+    def grouped_rows(self):
+        '''Yields the rows with repeated leading group cells blanked.'''
+        previous = None
+
+        for row in self.rows:
+            cells = list(row)
+
+            for n in range(self.group):
+                if previous is None or row[:n + 1] != previous[:n + 1]:
+                    break
+
+                cells[n] = ""
+
+            previous = row
+            yield cells
+
+
+    def slug(self):
+        return re.sub(r"[^a-z0-9]+", "_", self.title.lower()).strip("_")
+
+
+class Report:
+    def __init__(self, title, subtitles=None, now=None):
+        '''Report made of a title, subtitle lines (by default the time of
+           reporting) and tables.
+        '''
+        now = datetime.now() if now is None else now
+        self.title = title
+        self.subtitles = [("Performed on: {0}/{1}/{2} at {3}:{4}:{5}").format(
+                          now.year, now.month, now.day, now.hour, now.minute, now.second)] + (subtitles or [])
+        self.tables = []
+
+
+    def add_table(self, table):
+        self.tables.append(table)
+        return table
+
+
+    def markdown(self):
+        out = io.StringIO()
+        out.write(f"# {self.title}\n")
+
+        for subtitle in self.subtitles:
+            out.write(f"### {subtitle}\n")
+
+        for table in self.tables:
+            out.write(f"\n## {table.title}\n")
+
+            if table.note:
+                out.write(f"### {table.note}\n")
+
+            out.write("| " + " | ".join(table.headers) + " |\n")
+            out.write("| " + " | ".join("-" * len(header) for header in table.headers) + " |\n")
+
+            for cells in table.grouped_rows():
+                out.write("|" + "|".join(" " + cell.replace("|", "\\|") + " " if cell else " " for cell in cells) + "|\n")
+
+        return out.getvalue()
+
+
+    def html(self):
+        out = io.StringIO()
+        out.write(f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>{html.escape(self.title)}</title></head>\n<body>\n")
+        out.write(f"<h1>{html.escape(self.title)}</h1>\n")
+
+        for subtitle in self.subtitles:
+            out.write(f"<h3>{html.escape(subtitle)}</h3>\n")
+
+        for table in self.tables:
+            out.write(f"<h2>{html.escape(table.title)}</h2>\n")
+
+            if table.note:
+                out.write(f"<p>{html.escape(table.note)}</p>\n")
+
+            out.write("<table>\n<tr>" + "".join(f"<th>{html.escape(header)}</th>" for header in table.headers) + "</tr>\n")
+
+            for cells in table.grouped_rows():
+                out.write("<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in cells) + "</tr>\n")
+
+            out.write("</table>\n")
+
+        out.write("</body>\n</html>\n")
+        return out.getvalue()
+
+
+    def csv(self, table):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(table.headers)
+        writer.writerows(table.rows)
+
+        return out.getvalue()
+
+
+    def write(self, path):
+        '''Writes the report in the format of the path's extension. CSV output
+           is one <path stem>-<table>.csv file per table. Returns the paths
+           written.
+        '''
+        stem, extension = os.path.splitext(path)
+        fmt = extension.lstrip(".")
+
+        if fmt == "md":
+            outputs = {path: self.markdown()}
+        elif fmt == "html":
+            outputs = {path: self.html()}
+        elif fmt == "csv":
+            outputs = {f"{stem}-{table.slug()}.csv": self.csv(table) for table in self.tables}
+        else:
+            raise ValueError(f"Unknown report format {fmt!r}, expected one of {FORMATS}")
+
+        for output_path, text in outputs.items():
+            write_atomic(output_path, text)
+
+        return list(outputs)
+
+
+    def write_all(self, path, formats=("md",)):
+        '''Writes the report once in each format, as <path>.<format> with any
+           report extension of path replaced.
+        '''
+        stem, extension = os.path.splitext(path)
+
+        if extension.lstrip(".") not in FORMATS:
+            stem = path
+
+        return [output_path for fmt in formats for output_path in self.write(f"{stem}.{fmt}")]
+
+
+def write_atomic(path, text):
+    '''Writes text to a temporary file renamed into place once complete.'''
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w") as out:
+        out.write(text)
+
+    os.replace(tmp_path, path)
+
+
+def general_report(cube, now=None):
+    '''Monthly and yearly storage vs MongoDB counts, with transfer percentages,
+       and yearly counts per collection.
+    '''
+    report = Report("Storage VS MongoDB Count Report", now=now)
+
+    monthly = report.add_table(Table("Monthly Counts", ["Year", "Month", "Storage Count", "MongoDB DicomFilePath Count",
+                                                        "MongoDB StudyDate Count"], group=1))
+    storage_counts = cube.totals([cube_lib.STORAGE], "files", "month")
+    mongo_path_counts = cube.totals(cube.mongo, "path", "month", within=cube_lib.STORAGE)
+    mongo_study_counts = cube.totals(cube.mongo, "study", "month", within=cube_lib.STORAGE)
+
+    for year, months in cube.calendar(cube_lib.STORAGE).items():
+        for month in months:
+            label = year + "-" + month
+            monthly.add_row(year, month, storage_counts[label], mongo_path_counts[label], mongo_study_counts[label])
+
+    years = cube.years[cube_lib.STORAGE]
+    storage_counts = cube.totals([cube_lib.STORAGE], "files", "year")
+    storage = [storage_counts[year] for year in years]
+
+    for metric, tag in [("path", "DicomFilePath"), ("study", "StudyDate")]:
+        yearly = report.add_table(Table(f"Yearly Counts by {tag} tag", ["Year", "Storage Count", f"MongoDB {tag} Count",
+                                                                        "Transfer Percentage"]))
+        mongo_counts = cube.totals(cube.mongo, metric, "year", within=cube_lib.STORAGE)
+        mongo = [mongo_counts[year] for year in years]
+
+        for year, storage_count, mongo_count, percentage in zip(years, storage, mongo,
+                                                                cube_lib.transfer_percentage(mongo, storage)):
+            yearly.add_row(year, storage_count, mongo_count, f"{percentage:.7f}%")
+
+    collections = report.add_table(Table("Collection Counts", ["Collection", "Year", "MongoDB DicomFilePath Count",
+                                                               "MongoDB StudyDate Count"], group=1))
+
+    for collection in cube.mongo:
+        path_counts = cube.totals([collection], "path", "year")
+        study_counts = cube.totals([collection], "study", "year")
+
+        for year in cube.years[collection]:
+            collections.add_row(collection, year, path_counts[year], study_counts[year])
+
+    return report
+
+
+def detailed_report(cube, now=None):
+    '''Daily storage vs MongoDB counts over the days present in storage.'''
+    report = Report("Storage VS MongoDB Detailed Count Report", now=now)
+    daily = report.add_table(Table("Daily Counts", ["Year", "Month", "Day", "Storage Count", "MongoDB DicomFilePath Count",
+                                                    "MongoDB StudyDate Count"], group=2))
+    storage_counts = cube.totals([cube_lib.STORAGE], "files", "day")
+    mongo_path_counts = cube.totals(cube.mongo, "path", "day")
+    mongo_study_counts = cube.totals(cube.mongo, "study", "day")
+
+    for year, months in cube.calendar(cube_lib.STORAGE).items():
+        for month, days in months.items():
+            for day in days:
+                label = "-".join([year, month, day])
+                daily.add_row(year, month, day, storage_counts[label], mongo_path_counts[label], mongo_study_counts[label])
+
+    return report
+
+
+def unique_studies_report(cube, now=None):
+    '''Daily storage counts vs MongoDB unique StudyInstanceUID counts over the
+       days present in the unique-study counts.
+    '''
+    report = Report("Storage VS MongoDB count of unique StudyInstanceUID Report", now=now)
+    daily = report.add_table(Table("Daily Counts", ["Year", "Month", "Day", "Storage Count",
+                                                    "MongoDB unique StudyInstanceUID"], group=2,
+                                   note="Please note that these counts have been performed based on the DicomFilePath tag"))
+    storage_counts = cube.totals([cube_lib.STORAGE], "files", "day")
+    mongo_counts = cube.totals([cube_lib.UNIQUE], "studies", "day")
+
+    for year, months in cube.calendar(cube_lib.UNIQUE).items():
+        for month, days in months.items():
+            for day in days:
+                label = "-".join([year, month, day])
+                daily.add_row(year, month, day, storage_counts[label], mongo_counts[label])
+
+    return report
+
+
+## Report builders by name
+REPORTS = {"general": general_report, "detailed": detailed_report, "unique": unique_studies_report}
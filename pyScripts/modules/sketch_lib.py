@@ -0,0 +1,127 @@
+'''Library of mergeable, bounded-memory sketches for counting over large
+   collections.
+'''
+import math
+import base64
+import hashlib
+
+
+def hash64(value):
+    '''Returns a stable 64-bit hash of a value's string form.'''
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    def __init__(self, precision=12, registers=None):
+        '''Approximate distinct counter using 2**precision one-byte registers,
+           with a standard error of about 1.04 / sqrt(2**precision).
+        '''
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m) if registers is None else bytearray(registers)
+
+
+    def add(self, value):
+        x = hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+    def add_hash(self, index, rest, bits=63):
+        '''Adds a value by a hash computed elsewhere, given as its register
+           index and its bits-wide hash, of which only the bits above the
+           index bits are ranked (e.g. the smallest hash of a register, as
+           bucketed server-side). Sketches fed by add and by add_hash use
+           different hashes and must not be merged.
+        '''
+        rank = (bits - self.precision) - max(rest.bit_length() - self.precision, 0) + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+    def merge(self, other):
+        '''Merges another sketch of the same precision into this one, so that
+           it counts the union of both sets.
+        '''
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+
+    def count(self):
+        '''Returns the estimated number of distinct values added.'''
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)  # Linear counting for small sets
+
+        return int(round(estimate))
+
+
+    def to_json(self):
+        return {"precision": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode()}
+
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["precision"], base64.b64decode(data["registers"]))
+
+
+class SpaceSaving:
+    def __init__(self, k=20):
+        '''Heavy-hitters sketch keeping at most k counters. Any value occurring
+           more than n/k times in a stream of n is guaranteed to be kept, and
+           each kept count overestimates the true one by at most its error.
+        '''
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+
+
+    def add(self, item, weight=1):
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.k:
+            self.counts[item] = weight
+            self.errors[item] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+
+
+    def merge(self, other):
+        '''Merges another sketch into this one, keeping the k largest counters.
+           Values missing from a full sketch are credited with its smallest
+           count, which bounds how often they may have been dropped.
+        '''
+        floor = min(self.counts.values()) if len(self.counts) >= self.k else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.k else 0
+        counts = {}
+        errors = {}
+
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, floor) + other.errors.get(item, other_floor)
+
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.k]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        return self
+
+
+    def top(self, n=None):
+        '''Returns the n most frequent values as {value: count}, largest first.'''
+        return dict(sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n])
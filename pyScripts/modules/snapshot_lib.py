@@ -0,0 +1,159 @@
+'''Library that keeps count runs as snapshots of the count cube: one .npy
+   array of collection x day x metric counts and one of day presence per run,
+   memory-mapped on read, listed in a small JSON catalog. Queries only read
+   the rows and days they touch.
+
+   Requires numpy.
+'''
+import os
+import json
+from datetime import datetime
+from modules import cube_lib
+
+np = cube_lib.np
+
+CATALOG = "catalog.json"
+
+
+def days(start, end):
+    '''Returns the number of days from one datetime64 to another.'''
+    return int((end - start) // np.timedelta64(1, "D"))
+
+
+class Snapshot:
+    def __init__(self, directory, entry):
+        '''Read-only view of one run, its arrays memory-mapped.'''
+        self.entry = entry
+        self.run = entry["run"]
+        self.collections = entry["collections"]
+        self.start = np.datetime64(entry["start"])
+        self.counts = np.load(os.path.join(directory, entry["counts"]), mmap_mode="r")
+        self.present = np.load(os.path.join(directory, entry["present"]), mmap_mode="r")
+        self.end = self.start + self.counts.shape[1]
+
+
+    def rows(self, collections=None):
+        '''Returns the row indices of the given collections present in this
+           run, or of all its MongoDB collections by default.
+        '''
+        if collections is None:
+            collections = [collection for collection in self.collections
+                           if collection not in (cube_lib.STORAGE, cube_lib.UNIQUE)]
+
+        return [self.collections.index(collection) for collection in collections if collection in self.collections]
+
+
+    def series(self, metric, start, end, collections=None):
+        '''Returns the daily counts of a metric summed over collections for
+           the days in [start, end), zero outside this run.
+        '''
+        values = np.zeros(days(start, end), dtype=np.int64)
+        first = max(start, self.start)
+        last = min(end, self.end)
+        rows = self.rows(collections)
+
+        if first < last and rows:
+            values[days(start, first):days(start, last)] = \
+                self.counts[rows, days(self.start, first):days(self.start, last), cube_lib.METRICS.index(metric)].sum(axis=0)
+
+        return values
+
+
+class SnapshotStore:
+    def __init__(self, directory):
+        '''Directory of snapshot arrays and their catalog.'''
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.catalog_path = os.path.join(directory, CATALOG)
+        self.catalog = []
+
+        if os.path.exists(self.catalog_path):
+            with open(self.catalog_path) as catalog_file:
+                self.catalog = json.load(catalog_file)
+
+
+    def save(self, cube, run=None, label=None, sources=None):
+        '''Saves a count cube as a new run and returns its catalog entry.'''
+        created = datetime.now()
+        run = run or created.strftime("%Y-%m-%d_%H:%M:%S")
+
+        if any(entry["run"] == run for entry in self.catalog):
+            raise ValueError(f"Run {run} is already in the snapshot store")
+
+        entry = {
+            "run": run,
+            "label": label,
+            "created": created.isoformat(timespec="seconds"),
+            "sources": sources or {},
+            "collections": cube.collections,
+            "metrics": cube_lib.METRICS,
+            "years": cube.years,
+            "start": str(cube.dates[0]),
+            "days": len(cube.dates),
+            "counts": f"{run}.counts.npy",
+            "present": f"{run}.present.npy"
+        }
+
+        np.save(os.path.join(self.directory, entry["counts"]), cube.counts)
+        np.save(os.path.join(self.directory, entry["present"]), cube.present)
+
+        self.catalog.append(entry)
+        self.write_catalog()
+        print(f"Successfully saved snapshot {run} to {self.directory}")
+
+        return entry
+
+
+    def write_catalog(self):
+        tmp_path = self.catalog_path + ".tmp"
+
+        with open(tmp_path, "w") as catalog_file:
+            json.dump(self.catalog, catalog_file, indent=4)
+
+        os.replace(tmp_path, self.catalog_path)
+
+
+    def runs(self, label=None):
+        '''Returns the catalog entries, oldest first, optionally of one label.'''
+        return [entry for entry in self.catalog if label is None or entry["label"] == label]
+
+
+    def open(self, run):
+        for entry in self.catalog:
+            if entry["run"] == run:
+                return Snapshot(self.directory, entry)
+
+        raise KeyError(f"No run {run} in the snapshot store")
+
+
+    def delta(self, old_run, new_run, metric, collections=None, start=None, end=None):
+        '''Returns (dates, new - old) of the daily counts of a metric summed
+           over collections, over both runs' days by default.
+        '''
+        old = self.open(old_run)
+        new = self.open(new_run)
+        start = min(old.start, new.start) if start is None else np.datetime64(start, "D")
+        end = max(old.end, new.end) if end is None else np.datetime64(end, "D")
+
+        return np.arange(start, end), new.series(metric, start, end, collections) - old.series(metric, start, end, collections)
+
+
+    def trend(self, metric, collections=None, period="year", start=None, end=None, label=None):
+        '''Returns (runs, period labels, totals) with totals[run, period] the
+           count of a metric summed over collections in each run.
+        '''
+        snapshots = [Snapshot(self.directory, entry) for entry in self.runs(label)]
+
+        if not snapshots:
+            return [], [], np.zeros((0, 0), dtype=np.int64)
+
+        start = min(snapshot.start for snapshot in snapshots) if start is None else np.datetime64(start, "D")
+        end = max(snapshot.end for snapshot in snapshots) if end is None else np.datetime64(end, "D")
+        dates = np.arange(start, end)
+        daily = np.stack([snapshot.series(metric, start, end, collections) for snapshot in snapshots])
+
+        if period == "day":
+            return [snapshot.run for snapshot in snapshots], dates.astype(str).tolist(), daily
+
+        labels, starts = np.unique(dates.astype(f"datetime64[{cube_lib.PERIODS[period]}]"), return_index=True)
+        return [snapshot.run for snapshot in snapshots], labels.astype(str).tolist(), np.add.reduceat(daily, starts, axis=1)
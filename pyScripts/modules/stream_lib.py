@@ -0,0 +1,297 @@
+'''Library that streams the {year: {month: {day: payload}}} JSON trees written
+   by the count and crawl scripts one day at a time, reading the file in
+   chunks so that only the current day is ever decoded into memory.
+
+   Uses ijson (and its C backend when built) as the incremental parser when
+   installed, else a stdlib chunked reader. Whole-file loads go through
+   orjson when installed.
+'''
+import re
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+## Strings, unterminated string starts and brackets, for skipping values unparsed
+_SKIP_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]]')
+_WHITESPACE = re.compile(r"\s*")
+
+
+class JsonStream:
+    def __init__(self, json_file, chunk_size=1 << 20):
+        '''Incremental reader over a JSON text file. Values are decoded one at
+           a time with json.JSONDecoder.raw_decode, refilling the buffer from
+           the file whenever a value runs past its end.
+        '''
+        self.file = json_file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+
+    def fill(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+
+    def peek(self):
+        '''Returns the next non-whitespace character without consuming it.'''
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input")
+
+
+    def expect(self, chars):
+        char = self.peek()
+
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos} of buffer, found {char!r}")
+
+        self.pos += 1
+        return char
+
+
+    def value(self):
+        '''Decodes and returns the next value. A value ending exactly at the
+           end of the buffer, or a number followed by ".", "e" or "E", is
+           re-read after a refill, as it may be a truncated number.
+        '''
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                truncated = end == len(self.buffer) or (
+                    isinstance(value, (int, float)) and not isinstance(value, bool) and self.buffer[end] in ".eE")
+
+                if not truncated or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+
+            self.fill()
+
+
+    def skip(self):
+        '''Skips the next value without decoding it.'''
+        if self.peek() not in "{[":
+            self.value()
+            return
+
+        depth = 0
+
+        while True:
+            for match in _SKIP_TOKENS.finditer(self.buffer, self.pos):
+                token = match.group()
+
+                if token == '"':  # String continues past the end of the buffer
+                    self.pos = match.start()
+                    break
+
+                self.pos = match.end()
+
+                if token in "{[":
+                    depth += 1
+                elif token in "}]":
+                    depth -= 1
+
+                    if depth == 0:
+                        return
+            else:
+                self.pos = len(self.buffer)
+
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input")
+
+
+    def items(self):
+        '''Yields the keys of the next object one at a time. The caller must
+           consume (value or skip) each key's value before the next is read.
+        '''
+        self.expect("{")
+
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_records(path, depth=3, keys=None, chunk_size=1 << 20):
+    '''Yields (key_1, ..., key_depth, payload) for every value nested depth
+       objects deep, in file order: depth 3 for {year: {month: {day: payload}}}
+       trees, 4 for {collection: {year: ...}} Mongo counts. Top-level keys not
+       in keys (if given) are skipped without being decoded, and reading
+       stops once every one of keys has been read. Values above depth that are not objects
+       (e.g. false for a collection whose count failed) are reported and
+       skipped.
+    '''
+    if ijson is not None:
+        yield from _ijson_records(path, depth, keys)
+        return
+
+    with open(path) as json_file:
+        yield from _stream_records(JsonStream(json_file, chunk_size), depth, keys, ())
+
+
+def _stream_records(stream, depth, keys, parents):
+    remaining = None if keys is None else set(keys)
+
+    for key in stream.items():
+        if remaining is not None and not remaining:
+            return  # Every requested key has been read
+
+        if keys is not None and key not in keys:
+            stream.skip()
+        elif len(parents) + 1 == depth:
+            yield parents + (key, stream.value())
+        elif stream.peek() != "{":
+            _report_skip(parents + (key,))
+            stream.skip()
+        else:
+            yield from _stream_records(stream, depth, None, parents + (key,))
+
+        if remaining is not None:
+            remaining.discard(key)
+
+
+def _report_skip(keys):
+    print(f"Skipping {'/'.join(keys)}: expected an object")
+
+
+def _ijson_records(path, depth, keys):
+    with open(path, "rb") as json_file:
+        events = ijson.parse(json_file, use_float=True)
+        stack = []
+        remaining = None if keys is None else set(keys)
+
+        for _, event, value in events:
+            if event == "start_map":
+                stack.append(None)
+            elif event == "end_map":
+                stack.pop()
+            elif event == "map_key":
+                stack[-1] = value
+
+                if len(stack) == 1 and remaining is not None:
+                    if not remaining:
+                        return  # Every requested key has been read
+
+                    if value not in keys:
+                        _ijson_skip(events, next(events)[1])
+                        continue
+
+                    remaining.discard(value)
+
+                if len(stack) == depth:
+                    yield tuple(stack) + (_ijson_value(events),)
+                    continue
+
+                _, event, value = next(events)
+
+                if event == "start_map":
+                    stack.append(None)
+                    continue
+
+                _report_skip(tuple(stack))
+                _ijson_skip(events, event)
+
+
+def _ijson_skip(events, event):
+    '''Consumes the rest of a value starting with event, without building it.'''
+    level = 1 if event in ("start_map", "start_array") else 0
+
+    while level:
+        _, event, _ = next(events)
+
+        if event in ("start_map", "start_array"):
+            level += 1
+        elif event in ("end_map", "end_array"):
+            level -= 1
+
+
+def _ijson_value(events):
+    '''Builds the next value from an ijson event stream.'''
+    builder = ijson.common.ObjectBuilder()
+    level = 0
+
+    for _, event, value in events:
+        builder.event(event, value)
+
+        if event in ("start_map", "start_array"):
+            level += 1
+        elif event in ("end_map", "end_array"):
+            level -= 1
+
+        if level == 0:
+            return builder.value
+
+
+def iter_days(path, years=None, chunk_size=1 << 20):
+    '''Yields (year, month, day, payload) for every day of a JSON count tree,
+       in file order. Years not in years (if given) are skipped.
+    '''
+    return iter_records(path, 3, years, chunk_size)
+
+
+def walk_tree(tree, depth=3):
+    '''Yields the records iter_records would yield from an already loaded
+       tree.
+    '''
+    for key, value in tree.items():
+        if depth == 1:
+            yield (key, value)
+        else:
+            for record in walk_tree(value, depth - 1):
+                yield (key,) + record
+
+
+def load(path):
+    '''Loads a whole JSON file, through orjson when installed.'''
+    if orjson is not None:
+        with open(path, "rb") as json_file:
+            return orjson.loads(json_file.read())
+
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def list_years(path, chunk_size=1 << 20):
+    '''Returns the top-level (year) keys of a JSON count tree, skipping their
+       values unparsed.
+    '''
+    years = []
+
+    with open(path) as json_file:
+        stream = JsonStream(json_file, chunk_size)
+
+        for year in stream.items():
+            years.append(year)
+            stream.skip()
+
+    return years
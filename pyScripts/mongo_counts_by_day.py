@@ -0,0 +1,104 @@
+'''Script for counting the documents of every image collection per day, by
+   DicomFilePath and by StudyDate, in one grouped pass per collection.
+   As in the JS script, every collection but "series" is counted by default.
+   Collections are counted concurrently.
+   Replaces jsScripts/mongoCountsByDay.js.
+
+   Structure:
+       {collection: {year: {month: {day: [DicomFilePath count, StudyDate count]}}}}
+
+   After deduplication, only the days touched by mongo_dedup.py need to be
+   recounted: the counts of an earlier run are patched with a recount of
+   those days.
+
+   Usage:
+      python3 mongo_counts_by_day.py -f counts.json -min 2010 -max 2018
+      python3 mongo_counts_by_day.py -f imageCounts.json -p 'image_*'
+      python3 mongo_counts_by_day.py -f countsAfter.json -b countsBefore.json -t touched.json
+'''
+import argparse
+import modules.file_lib as flib
+from modules import columnar_lib, stream_lib
+from modules.mongo_lib import DbLib, patch_day_counts
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--minyear", "-min", help = "First year to be counted. Default to 2010.", type = int, required = False, default = 2010)
+    parser.add_argument("--maxyear", "-max", help = "Last year to be counted. Default to 2018.", type = int, required = False, default = 2018)
+    parser.add_argument("--pattern", "-p", help = "Pattern of collections to be counted. Default to * (e.g. image_* for the image collections only).", type = str, required = False, default = "*")
+    parser.add_argument("--exclude", "-x", help = "Patterns of collections not to be counted. Default to series.", type = str, nargs = "*", required = False, default = ["series"])
+    parser.add_argument("--workers", "-w", help = "Number of collections counted concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the query result, or of a .parquet/.arrow table.", type = str, required = True)
+    parser.add_argument("--base", "-b", help = "Counts file of an earlier run to be patched instead of counting every day. Requires --touched.", type = str, required = False, default = None)
+    parser.add_argument("--touched", "-t", help = "JSON file of the days touched since the --base run, as written by mongo_dedup.py.", type = str, required = False, default = None)
+
+    args = parser.parse_args()
+
+    if (args.base is None) != (args.touched is None):
+        parser.error("--base and --touched must be given together")
+
+    return args
+
+
+def read_counts(path):
+    if path.endswith((".parquet", ".arrow")):
+        return columnar_lib.read_counts(path)
+
+    return stream_lib.load(path)
+
+
+def recount(db, args):
+    '''Returns the counts of the --base run with the --touched days of each
+       collection recounted. Collections without base counts are counted in
+       full, and so is every collection if either file is missing or cannot
+       be loaded.
+    '''
+    try:
+        counts = read_counts(args.base)
+        touched = stream_lib.load(args.touched)
+    except (OSError, ValueError) as error:
+        print(f"Failed loading {args.base} and {args.touched}, counting every day instead: {error}")
+        return db.fan_out("count_by_day", args.minyear, args.maxyear, pattern=args.pattern, exclude=args.exclude, workers=args.workers)
+
+    def recount_collection(collection):
+        if not counts.get(collection):
+            return db.count_by_day(collection, args.minyear, args.maxyear)
+
+        days = touched.get(collection)
+
+        if not days:
+            return counts[collection]
+
+        recounts = db.count_days(collection, days["path"], days["study"])
+
+        if recounts is False:
+            return False
+
+        return patch_day_counts(counts[collection], recounts)
+
+    return db.fan_out(recount_collection, pattern=args.pattern, exclude=args.exclude, workers=args.workers)
+
+
+def main(args):
+    db = DbLib(read_preference="secondaryPreferred" if args.base is None else "primary")  # A recount must see the deletions
+    db.switch_db(args.database)
+
+    if args.base is None:
+        counts = db.fan_out("count_by_day", args.minyear, args.maxyear,
+                            pattern=args.pattern, exclude=args.exclude, workers=args.workers)
+    else:
+        counts = recount(db, args)
+
+    if args.filepath.endswith((".parquet", ".arrow")):
+        columnar_lib.write_counts(counts, args.filepath, "mongo")
+    else:
+        flib.json_dump(counts, args.filepath)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
@@ -0,0 +1,51 @@
+'''Script for deleting documents duplicated by header.DicomFilePath from every
+   image collection, keeping the document with the lowest _id.
+   Collections are processed in parallel. Replaces jsScripts/deleteDupsByFilePath.js.
+
+   Usage:
+    - Dry run, writing a manifest of the duplicates per collection
+        python3 mongo_dedup.py --dry-run -m manifests/
+    - Delete duplicates
+        python3 mongo_dedup.py -m manifests/ -f dedup_stats.json
+    - Delete duplicates, writing the days touched for mongo_counts_by_day.py to recount
+        python3 mongo_dedup.py -m manifests/ -t touched.json
+'''
+import argparse
+import modules.file_lib as flib
+from modules.mongo_lib import DbLib
+from modules.dedup_lib import Deduplicator
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--pattern", "-p", help = "Pattern of collections to be deduplicated. Default to image_*.", type = str, required = False, default = "image_*")
+    parser.add_argument("--workers", "-w", help = "Number of collections processed in parallel. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--chunk", "-k", help = "Number of deletions per bulk write. Default to 1000.", type = int, required = False, default = 1000)
+    parser.add_argument("--manifest", "-m", help = "Directory for the duplicate manifests. Optional.", type = str, required = False, default = None)
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the run statistics. Optional.", type = str, required = False, default = None)
+    parser.add_argument("--touched", "-t", help = "Path and name of JSON file for the days touched by deletions. Not written on a dry run. Optional.", type = str, required = False, default = None)
+    parser.add_argument("--dry-run", help = "Find duplicates without deleting them.", action = "store_true")
+
+    return parser.parse_args()
+
+
+def main(args):
+    db = DbLib()
+    db.switch_db(args.database)
+
+    dedup = Deduplicator(db, chunk_size=args.chunk, dry_run=args.dry_run, manifest_dir=args.manifest)
+    stats = dedup.run(args.pattern, args.workers)
+
+    if args.filepath is not None:
+        flib.json_dump(stats, args.filepath)
+
+    if args.touched is not None:
+        dedup.write_touched(args.touched)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
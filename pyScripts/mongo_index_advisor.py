@@ -0,0 +1,47 @@
+'''Script for explaining the query shapes of DbLib, the deduplicator and the
+   JS scripts (day recounts, duplicate lookups, stratified sampling, modality
+   counts and groups, DirectoryPath scans) against every collection matching a
+   pattern, reporting winning plans, unused indexes and the single-field or
+   compound indexes missing for shapes that scan the whole collection.
+
+   Usage:
+    - Advise using query plans only
+        python3 mongo_index_advisor.py -f index_advice.json
+    - Execute the shapes for keys/documents examined and create missing indexes
+        python3 mongo_index_advisor.py -f index_advice.json --execute --apply
+'''
+import argparse
+import modules.file_lib as flib
+from modules.mongo_lib import DbLib
+from modules.index_lib import IndexAdvisor
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--pattern", "-p", help = "Pattern of collections to be checked. Default to image_*.", type = str, required = False, default = "image_*")
+    parser.add_argument("--workers", "-w", help = "Number of collections checked concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the advice.", type = str, required = True)
+    parser.add_argument("--execute", help = "Run the query shapes to collect execution stats.", action = "store_true")
+    parser.add_argument("--apply", help = "Create the missing indexes.", action = "store_true")
+
+    return parser.parse_args()
+
+
+def main(args):
+    db = DbLib()
+    db.switch_db(args.database)
+
+    advisor = IndexAdvisor(db, verbosity="executionStats" if args.execute else "queryPlanner")
+    advice = advisor.run(args.pattern, args.workers)
+    flib.json_dump(advice, args.filepath)
+
+    if args.apply:
+        advisor.apply(advice)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
@@ -1,4 +1,6 @@
 '''Script for retrieving a list of unique tags from a collection.
+   Use -s to inspect sampled batches until no new tags appear instead
+   of scanning the whole collection.
 '''
 import argparse
 import modules.file_lib as flib
@@ -10,6 +12,12 @@ def argparser():
     parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to analytics.", type = str, required = False, default = "analytics")
     parser.add_argument("--collection", "-c", help = "Name of MongoDB collection.", type = str, required = True)
     parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the query result.", type = str, required = True)
+    parser.add_argument("--cache", help = "Directory of the query result cache. Default to no caching.", type = str, required = False, default = None)
+    parser.add_argument("--ttl", help = "Hours a cached result stays valid. Default to 6.", type = float, required = False, default = 6)
+    parser.add_argument("--refresh", help = "Ignore cached results and recompute them.", action = "store_true")
+    parser.add_argument("--depth", "-n", help = "Depth of nested sub-documents to walk. Default to 2 (e.g. header.*).", type = int, required = False, default = 2)
+    parser.add_argument("--sample", "-s", help = "Size of sampled batches. Default to a full collection scan.", type = int, required = False, default = None)
+    parser.add_argument("--patience", "-p", help = "Consecutive sampled batches without new tags before stopping. Default to 3.", type = int, required = False, default = 3)
 
     return parser.parse_args()
 
@@ -18,7 +26,10 @@ def main(args):
     db = DbLib()
     db.switch_db(args.database)
 
-    flib.json_dump(db.list_tags(args.collection), args.filepath)
+    if args.cache is not None:
+        db.enable_cache(args.cache, ttl=args.ttl * 3600, refresh=args.refresh)
+
+    flib.json_dump(db.list_tags(args.collection, args.depth, args.sample, args.patience), args.filepath)
 
     db.disconnect()
 
@@ -0,0 +1,39 @@
+'''Long-running service that keeps per-day and per-modality counts of the image
+   collections up to date from a MongoDB change stream.
+   A baseline is taken on the first run; afterwards the counters and the change
+   stream resume token are checkpointed so the service can be restarted.
+   Requires a replica set (a local single-node one is enough for testing).
+   Deletes can only be attributed to a day with changeStreamPreAndPostImages
+   enabled on the collections; the service refuses to start without it unless
+   --enable-pre-images is given to enable it.
+
+   Usage:
+      python3 mongo_live_counts.py -k live_counts_state.json -o counts.json
+'''
+import argparse
+from modules.counter_lib import LiveCounter
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--pattern", "-p", help = "Pattern of collections to be counted. Default to image_*.", type = str, required = False, default = "image_*")
+    parser.add_argument("--minyear", "-min", help = "First year of the baseline. Default to 2010.", type = int, required = False, default = 2010)
+    parser.add_argument("--maxyear", "-max", help = "Last year of the baseline. Default to 2018.", type = int, required = False, default = 2018)
+    parser.add_argument("--checkpoint", "-k", help = "Path of the checkpoint file holding counters and resume token.", type = str, required = True)
+    parser.add_argument("--every", "-e", help = "Number of change events between checkpoints. Default to 1000.", type = int, required = False, default = 1000)
+    parser.add_argument("--output", "-o", help = "Path of the per-day counts file in report format. Optional.", type = str, required = False, default = None)
+    parser.add_argument("--enable-pre-images", help = "Enable changeStreamPreAndPostImages on collections missing it.", action = "store_true")
+
+    return parser.parse_args()
+
+
+def main(args):
+    counter = LiveCounter(args.database, args.checkpoint, args.pattern, args.minyear, args.maxyear)
+    counter.run(args.every, args.output, args.enable_pre_images)
+    counter.close()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
@@ -0,0 +1,65 @@
+'''Script for validating the DicomFilePath of every document in a collection
+   client-side, using the partitioned parallel scanner of DbLib.
+   Counts the documents whose path does not start with a valid
+   yyyy/mm/dd/accession directory and keeps a few examples of them.
+
+   Usage:
+      python3 mongo_path_check.py -c image_CT -f path_check.json -w 8
+'''
+import re
+import argparse
+import modules.file_lib as flib
+from modules.mongo_lib import DbLib
+
+PATH_REGEX = re.compile(r"^\d{4}/(0[1-9]|1[0-2])/(0[1-9]|[12]\d|3[01])/[^/]+/")
+MAX_EXAMPLES = 20
+EMPTY_CHECK = {"total": 0, "invalid": 0, "examples": []}
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection.", type = str, required = True)
+    parser.add_argument("--workers", "-w", help = "Number of scanning processes. Default to the number of cores.", type = int, required = False, default = None)
+    parser.add_argument("--partitions", "-n", help = "Number of _id ranges. Default to four per worker.", type = int, required = False, default = None)
+    parser.add_argument("--split", "-s", help = "Partitioning: time (ObjectId timestamps) or bucket ($bucketAuto). Default to time.", type = str, required = False, default = "time")
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the check result.", type = str, required = True)
+
+    return parser.parse_args()
+
+
+def check_path(doc):
+    path = (doc.get("header") or {}).get("DicomFilePath")
+    invalid = not isinstance(path, str) or PATH_REGEX.match(path) is None
+
+    return {"total": 1, "invalid": int(invalid), "examples": [str(path)] if invalid else []}
+
+
+def add_checks(a, b):
+    if a is None:
+        return b
+
+    if b is None:
+        return a
+
+    return {
+        "total": a["total"] + b["total"],
+        "invalid": a["invalid"] + b["invalid"],
+        "examples": (a["examples"] + b["examples"])[:MAX_EXAMPLES]
+    }
+
+
+def main(args):
+    db = DbLib()
+    db.switch_db(args.database)
+
+    result = db.scan(args.collection, check_path, add_checks, initial=dict(EMPTY_CHECK), projection={"_id": 0, "header.DicomFilePath": 1},
+                     partitions=args.partitions, workers=args.workers, split=args.split)
+    flib.json_dump(result, args.filepath)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
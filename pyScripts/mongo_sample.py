@@ -5,9 +5,14 @@
         python3 sample.py -c image_MR -p outputs/sample.json
     - For two samples from collection image_MR
         python3 sample.py -c image_MR -p outputs/ -n 2
+    - For up to five samples per year and modality from collection image_MR,
+      streamed to a single NDJSON file
+        python3 sample.py -c image_MR -p outputs/samples.ndjson -n 5 --stratify
 '''
 import os
+import sys
 import argparse
+import itertools
 import modules.file_lib as flib
 from modules.mongo_lib import DbLib
 
@@ -15,8 +20,12 @@ from modules.mongo_lib import DbLib
 def argparser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--collection", "-c", help = "Name of MongoDB collection.", type = str, required = True)
-    parser.add_argument("--path", "-p", help = "Path to directory or file for the query result.", type = str, required = True)
-    parser.add_argument("--number", "-n", help = "Number of samples to extract. Default to 1.", type = int, required = False, default = 1)
+    parser.add_argument("--path", "-p", help = "Path to directory or file for the query result. Use .ndjson to stream all samples to one file.", type = str, required = True)
+    parser.add_argument("--number", "-n", help = "Number of samples to extract, per year and modality if stratified. Default to 1.", type = int, required = False, default = 1)
+    parser.add_argument("--stratify", "-s", help = "Sample each year and modality separately.", action = "store_true")
+    parser.add_argument("--minyear", "-min", help = "First year of stratified samples. Default to 2010.", type = int, required = False, default = 2010)
+    parser.add_argument("--maxyear", "-max", help = "Last year of stratified samples. Default to 2018.", type = int, required = False, default = 2018)
+    parser.add_argument("--workers", "-w", help = "Number of concurrent queries and file writes. Default to 4.", type = int, required = False, default = 4)
 
     return parser.parse_args()
 
@@ -24,29 +33,32 @@ def argparser():
 def main(args):
     col = args.collection
     path = args.path
-    number = args.number
-    filenames = []
 
-    if os.path.isfile(path) or ".json" in path:
-        filenames.append(path)
-    elif os.path.isdir(path):
-        for n in range(0, number):
-            filename = os.path.join(path, f"sample_{col}_{n}.json")
-            filenames.append(filename)
+    if ".ndjson" in path:
+        filenames = None
+    elif os.path.isfile(path) or ".json" in path:
+        filenames = [path]
+    else:
+        filenames = (os.path.join(path, f"sample_{col}_{n}.json") for n in itertools.count())
 
     db = DbLib()
     db.switch_db("analytics")
 
-    samples = db.sample(col, number)
-    files = 0
+    samples = db.sample(col, args.number, lazy=True, stratify=args.stratify,
+                        min_year=args.minyear, max_year=args.maxyear, workers=args.workers)
 
-    for sample in samples:
-        flib.json_dump(sample, filenames[files])
-        files += 1
+    if samples is False:
+        db.disconnect()
+        sys.exit(1)
+
+    if filenames is None:
+        flib.stream_dump(samples, path)
+    else:
+        flib.dump_each(samples, filenames, args.workers)
 
     db.disconnect()
 
 
 if __name__ == '__main__':
     args = argparser()
-    main(args)
\ No newline at end of file
+    main(args)
@@ -9,17 +9,31 @@ from modules.mongo_lib import DbLib
 def argparser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to analytics.", type = str, required = False, default = "analytics")
-    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection.", type = str, required = True)
+    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection, or a pattern (e.g. image_*) to query all matching collections concurrently.", type = str, required = True)
+    parser.add_argument("--workers", "-w", help = "Number of collections queried concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--timeout", help = "Per-collection timeout in seconds. Default to none.", type = float, required = False, default = None)
     parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the query result.", type = str, required = True)
+    parser.add_argument("--cache", help = "Directory of the query result cache. Default to no caching.", type = str, required = False, default = None)
+    parser.add_argument("--ttl", help = "Hours a cached result stays valid. Default to 6.", type = float, required = False, default = 6)
+    parser.add_argument("--refresh", help = "Ignore cached results and recompute them.", action = "store_true")
 
     return parser.parse_args()
 
 
 def main(args):
-    db = DbLib()
+    db = DbLib(read_preference="secondaryPreferred")
     db.switch_db(args.database)
 
-    flib.json_dump(db.count_images(args.collection), args.filepath)
+    if args.cache is not None:
+        db.enable_cache(args.cache, ttl=args.ttl * 3600, refresh=args.refresh)
+
+    if any(char in args.collection for char in "*?["):
+        result = db.fan_out("count_images", pattern=args.collection,
+                            workers=args.workers, timeout=args.timeout)
+    else:
+        result = db.count_images(args.collection)
+
+    flib.json_dump(result, args.filepath)
 
     db.disconnect()
 
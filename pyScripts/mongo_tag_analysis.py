@@ -8,19 +8,27 @@ from modules.mongo_lib import DbLib
 def argparser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to analytics.", type = str, required = False, default = "analytics")
-    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection.", type = str, required = True)
+    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection, or a pattern (e.g. image_*) to query all matching collections concurrently.", type = str, required = True)
     parser.add_argument("--tag", "-t", help = "Name of tag to check.", type = str, required = True)
-    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the query result.", type = str, required = True)
+    parser.add_argument("--workers", "-w", help = "Number of collections queried concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--timeout", help = "Per-collection timeout in seconds. Default to none.", type = float, required = False, default = None)
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the query result. Use .ndjson for NDJSON and .gz for gzip.", type = str, required = True)
 
     return parser.parse_args()
 
 
 def main(args):
-    db = DbLib()
+    db = DbLib(read_preference="secondaryPreferred")
     db.switch_db(args.database)
 
     #flib.json_dump(db.list_unique_vals(args.collection, args.tag), args.filepath)
-    flib.json_dump(db.list_null_vals(args.collection, args.tag), args.filepath)
+    if any(char in args.collection for char in "*?["):
+        result = db.fan_out("list_null_vals", args.tag, pattern=args.collection,
+                            workers=args.workers, timeout=args.timeout)
+        flib.json_dump(result, args.filepath)
+    else:
+        fmt = "ndjson" if ".ndjson" in args.filepath else "json"
+        flib.stream_dump(db.list_null_vals(args.collection, args.tag, lazy=True), args.filepath, fmt)
 
     db.disconnect()
 
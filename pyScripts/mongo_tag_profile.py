@@ -0,0 +1,48 @@
+'''Script for profiling the availability and most common values of several tags
+   across the years and modalities in one scan per collection.
+   Replaces the per-day queries of jsScripts/tagPropPerColl.js: one
+   <tag>_<modality>.json file per tag and modality is written to the output
+   directory, ready for analysis/tagAnalysis/generate_tag_report.py -c.
+
+   Usage:
+      python3 mongo_tag_profile.py -c image_MR -t AngioFlag FlipAngle -o profiles/
+'''
+import argparse
+from modules.mongo_lib import DbLib
+from modules.profile_lib import TagProfiler, write_reports
+from modules.columnar_lib import ColumnarWriter, tag_rows
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection, or a pattern (e.g. image_*).", type = str, required = True)
+    parser.add_argument("--tags", "-t", help = "Names of tags to profile.", type = str, nargs = "+", required = True)
+    parser.add_argument("--counters", "-k", help = "Counters kept per tag, year and modality. Default to 20.", type = int, required = False, default = 20)
+    parser.add_argument("--top", help = "Number of most common values written. Default to 5.", type = int, required = False, default = 5)
+    parser.add_argument("--workers", "-w", help = "Number of collections profiled concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--outdir", "-o", help = "Directory for the profile files.", type = str, required = True)
+    parser.add_argument("--columnar", help = "Path of a .parquet/.arrow table of all tags, modalities and years. Optional.", type = str, required = False, default = None)
+
+    return parser.parse_args()
+
+
+def main(args):
+    db = DbLib(read_preference="secondaryPreferred")
+    db.switch_db(args.database)
+
+    profiler = TagProfiler(db, args.tags, args.counters)
+    profile = profiler.run(args.collection, args.workers)
+    write_reports(profile, args.outdir, args.top)
+
+    if args.columnar is not None:
+        with ColumnarWriter(args.columnar, "tags") as writer:
+            for row in tag_rows(profile, args.top):
+                writer.write(row)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
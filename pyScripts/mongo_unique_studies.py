@@ -0,0 +1,78 @@
+'''Script for counting the unique StudyInstanceUIDs per DicomFilePath day in one
+   grouped pass per collection. Replaces jsScripts/mongoCountUniqueStudiesByCollection.js
+   and writes the {year: {month: {day: count}}} file read by
+   analysis/counts/uniqueStudyCounts/generate_unique_studies_report.py.
+
+   With a collection pattern, exact counts are summed over the collections, so
+   a study present in two collections is counted twice. With --approximate,
+   HyperLogLog sketches are merged across collections instead, counting each
+   study once; the merged sketches can be kept with -k for later merging.
+   --approximate hashes the UIDs on the server and requires MongoDB 7.0.
+
+   Usage:
+      python3 mongo_unique_studies.py -c image_CT -f unique_studies.json
+      python3 mongo_unique_studies.py -c "image_*" --approximate -f unique_studies.json -k sketches.json
+'''
+import argparse
+import modules.file_lib as flib
+from modules.mongo_lib import DbLib
+
+
+def argparser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", "-d", help = "Name of MongoDB database. Default to dicom.", type = str, required = False, default = "dicom")
+    parser.add_argument("--collection", "-c", help = "Name of MongoDB collection, or a pattern (e.g. image_*). Default to image_CT.", type = str, required = False, default = "image_CT")
+    parser.add_argument("--minyear", "-min", help = "First year to be counted. Default to 2010.", type = int, required = False, default = 2010)
+    parser.add_argument("--maxyear", "-max", help = "Last year to be counted. Default to 2018.", type = int, required = False, default = 2018)
+    parser.add_argument("--workers", "-w", help = "Number of collections counted concurrently. Default to 4.", type = int, required = False, default = 4)
+    parser.add_argument("--approximate", help = "Use HyperLogLog sketches instead of exact counts.", action = "store_true")
+    parser.add_argument("--precision", help = "HyperLogLog precision (2**p registers per day). Default to 12.", type = int, required = False, default = 12)
+    parser.add_argument("--sketches", "-k", help = "Path and name of JSON file for the merged sketches. Optional.", type = str, required = False, default = None)
+    parser.add_argument("--filepath", "-f", help = "Path and name of JSON file for the counts.", type = str, required = True)
+
+    return parser.parse_args()
+
+
+def merge_days(trees, merge):
+    '''Merges {year: {month: {day: value}}} trees day by day.'''
+    merged = {}
+
+    for tree in trees:
+        for year in tree:
+            for month in tree[year]:
+                for day, value in tree[year][month].items():
+                    days = merged.setdefault(year, {}).setdefault(month, {})
+                    days[day] = merge(days[day], value) if day in days else value
+
+    return merged
+
+
+def map_days(tree, func):
+    return {year: {month: {day: func(value) for day, value in tree[year][month].items()}
+                   for month in tree[year]} for year in tree}
+
+
+def main(args):
+    db = DbLib(read_preference="secondaryPreferred")
+    db.switch_db(args.database)
+
+    results = db.fan_out("count_unique_studies_by_day", args.minyear, args.maxyear,
+                         approximate=args.approximate, precision=args.precision,
+                         pattern=args.collection, workers=args.workers)
+    trees = [tree for tree in results.values() if tree]
+
+    if args.approximate:
+        sketches = merge_days(trees, lambda a, b: a.merge(b))
+        flib.json_dump(map_days(sketches, lambda sketch: sketch.count()), args.filepath)
+
+        if args.sketches is not None:
+            flib.json_dump(map_days(sketches, lambda sketch: sketch.to_json()), args.sketches)
+    else:
+        flib.json_dump(merge_days(trees, lambda a, b: a + b), args.filepath)
+
+    db.disconnect()
+
+
+if __name__ == '__main__':
+    args = argparser()
+    main(args)
@@ -0,0 +1,5 @@
+'''Puts pyScripts on the path so that tests import modules as the scripts do.'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
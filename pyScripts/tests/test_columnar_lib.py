@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from modules import columnar_lib, stream_lib
+from modules.sketch_lib import SpaceSaving
+
+MONGO = {"image_CT": {"2016": {"01": {"01": [1, 2], "31": [3, 4]}}},
+         "image_MR": {"2017": {"12": {"31": [5, 0]}}}}
+STORAGE = {"2016": {"02": {"29": 12}}, "2017": {"01": {"01": 0}}}
+
+
+@pytest.fixture(params=["parquet", "arrow"])
+def extension(request):
+    return request.param
+
+
+def test_mongo_round_trip(tmp_path, extension):
+    path = str(tmp_path / f"counts.{extension}")
+
+    assert columnar_lib.write_counts(dict(MONGO, image_PT=False), path, "mongo", batch_rows=2) == ["image_PT"]
+    assert columnar_lib.read_counts(path) == MONGO
+    assert [item.name for item in tmp_path.iterdir()] == [f"counts.{extension}"]
+
+
+def test_storage_round_trip(tmp_path, extension):
+    path = str(tmp_path / f"storage.{extension}")
+    columnar_lib.write_counts(STORAGE, path, "storage")
+
+    assert columnar_lib.read_counts(path) == STORAGE
+    assert columnar_lib.read_table(path).schema.names == ["date", "files"]
+
+
+def test_write_records(tmp_path, extension):
+    path = str(tmp_path / f"counts.{extension}")
+    columnar_lib.write_records(stream_lib.walk_tree(MONGO, 4), path, "mongo", batch_rows=1)
+
+    assert columnar_lib.read_counts(path) == MONGO
+
+
+def test_failed_write_leaves_no_table(tmp_path):
+    path = str(tmp_path / "counts.parquet")
+
+    with pytest.raises(KeyError):
+        with columnar_lib.ColumnarWriter(path, "storage") as writer:
+            writer.write({"date": None})
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_tag_rows_round_trip(tmp_path):
+    values = SpaceSaving(3)
+    values.add("YES", 4)
+    values.add("NO", 1)
+    profile = {"AngioFlag": {"MR": {"2016": {"total_count": 6, "tag_count": 5, "values": values}}}}
+    path = str(tmp_path / "tags.parquet")
+
+    with columnar_lib.ColumnarWriter(path, "tags") as writer:
+        for row in columnar_lib.tag_rows(profile):
+            writer.write(row)
+
+    counts = columnar_lib.read_tag_counts(path, "AngioFlag", "MR")
+
+    assert counts["2016"]["all"]["all"]["total_count"] == 6
+    assert counts["2016"]["all"]["all"]["values"] == {"YES": 4, "NO": 1}
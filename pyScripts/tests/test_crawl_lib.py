@@ -0,0 +1,83 @@
+import os
+from modules import crawl_lib
+
+
+def make_tree(root, days):
+    '''Creates root/year/month/day/accession/file_n for {"Y/M/D": {accession: files}}.'''
+    for key, studies in days.items():
+        for study, files in studies.items():
+            study_path = os.path.join(root, *key.split("/"), study)
+            os.makedirs(study_path)
+
+            for n in range(files):
+                with open(os.path.join(study_path, f"file_{n}"), "w") as out:
+                    out.write("x" * n)
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = crawl_lib.DirManifest(path, "/pacs")
+    manifest.put("2016/01/01", 5, "accessions", {"A1": [2, None]})
+    manifest.put("2017/01/01", 6, "accessions", {"B1": [1, None]})
+    manifest.save()
+
+    manifest = crawl_lib.DirManifest(path, "/pacs")
+
+    assert manifest.get("2016/01/01", 5, "accessions") == {"A1": [2, None]}
+    assert manifest.get("2016/01/01", 6, "accessions") is None  # Changed since
+    assert manifest.get("2016/01/01", 5, "accession_names") is None
+
+    manifest.prune([2016], {"2016/01/02"})
+
+    assert list(manifest.days) == ["2017/01/01"]
+
+
+def test_manifest_of_another_tree_is_ignored(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = crawl_lib.DirManifest(path, "/pacs")
+    manifest.put("2016/01/01", 5, "accessions", {})
+    manifest.save()
+
+    assert crawl_lib.DirManifest(path, "/other").days == {}
+
+
+def test_crawl_counts_and_studies(tmp_path):
+    make_tree(str(tmp_path), {"2016/01/01": {"A1": 2, "A2": 3}, "2016/02/29": {"B1": 1}})
+
+    for granularity in ["day", "accession"]:
+        counts = crawl_lib.crawl_counts([2016], workers=2, granularity=granularity, pacs_dir=str(tmp_path))
+
+        assert counts["2016"]["01"] == {"01": 5}
+        assert counts["2016"]["02"] == {"29": 1}
+        assert counts["2016"]["12"] == {}
+
+    studies = crawl_lib.crawl_studies([2016], workers=2, pacs_dir=str(tmp_path))
+
+    assert studies["2016"]["01"] == {"01": ["A1", "A2"]}
+
+
+def test_crawl_sizes(tmp_path):
+    make_tree(str(tmp_path), {"2016/01/01": {"A1": 3}})
+
+    sizes, = crawl_lib.crawl([2016], [crawl_lib.StudySizes()], workers=2, pacs_dir=str(tmp_path))
+
+    assert sizes["2016"]["01"]["01"] == {"A1": {"files": 3, "bytes": 3}}
+
+
+def test_crawl_reuses_the_manifest(tmp_path):
+    pacs_dir = str(tmp_path / "pacs")
+    make_tree(pacs_dir, {"2016/01/01": {"A1": 2}, "2016/01/02": {"A2": 1}})
+    manifest = crawl_lib.DirManifest(str(tmp_path / "manifest.json"), pacs_dir)
+
+    assert crawl_lib.crawl_counts([2016], workers=2, pacs_dir=pacs_dir, manifest=manifest)["2016"]["01"] == {"01": 2, "02": 1}
+
+    # A new file in an existing accession directory leaves the day's mtime unchanged
+    with open(os.path.join(pacs_dir, "2016", "01", "01", "A1", "new"), "w"):
+        pass
+
+    make_tree(pacs_dir, {"2016/01/03": {"A3": 4}})
+    manifest = crawl_lib.DirManifest(str(tmp_path / "manifest.json"), pacs_dir)
+
+    assert crawl_lib.crawl_counts([2016], workers=2, pacs_dir=pacs_dir, manifest=manifest)["2016"]["01"] == {"01": 2, "02": 1, "03": 4}
+    assert crawl_lib.crawl_counts([2016], workers=2, pacs_dir=pacs_dir, manifest=manifest, check=3)["2016"]["01"] == {"01": 3, "02": 1, "03": 4}
+    assert crawl_lib.crawl_counts([2016], workers=2, pacs_dir=pacs_dir, full=True)["2016"]["01"] == {"01": 3, "02": 1, "03": 4}
@@ -0,0 +1,67 @@
+import json
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules import cube_lib
+
+STORAGE = {"2016": {"01": {"01": 10, "31": 5}, "02": {"01": 7}}}
+MONGO = {"image_CT": {"2016": {"01": {"01": [4, 3], "02": [1, 1]}}},
+         "image_MR": {"2016": {"02": {"01": [6, 7]}}, "2017": {"12": {"31": [2, 2]}}}}
+UNIQUE = {"2016": {"01": {"01": 2}}}
+
+
+def test_collection_order_and_years():
+    cube = cube_lib.load_cube(STORAGE, MONGO, UNIQUE)
+
+    assert cube.collections == ["storage", "image_CT", "image_MR", "unique"]
+    assert cube.mongo == ["image_CT", "image_MR"]
+    assert cube.years == {"storage": ["2016"], "image_CT": ["2016"], "image_MR": ["2016", "2017"], "unique": ["2016"]}
+    assert str(cube.dates[0]) == "2016-01-01" and str(cube.dates[-1]) == "2017-12-31"
+
+
+def test_totals_by_period():
+    cube = cube_lib.load_cube(STORAGE, MONGO)
+
+    assert cube.totals(["storage"], "files", "year") == {"2016": 22, "2017": 0}
+    assert cube.totals(cube.mongo, "path", "month")["2016-01"] == 5
+    assert cube.totals(cube.mongo, "study", "day")["2016-02-01"] == 7
+
+
+def test_totals_within_present_days():
+    cube = cube_lib.load_cube(STORAGE, MONGO)
+
+    # 2016-01-02 and 2017-12-31 are not storage days
+    assert cube.totals(cube.mongo, "path", "year", within="storage") == {"2016": 10, "2017": 0}
+
+
+def test_calendar():
+    cube = cube_lib.load_cube(STORAGE, MONGO)
+    calendar = cube.calendar("storage")
+
+    assert list(calendar) == ["2016"]
+    assert len(calendar["2016"]) == 12
+    assert calendar["2016"]["01"] == ["01", "31"] and calendar["2016"]["03"] == []
+
+
+def test_transfer_percentage():
+    result = cube_lib.transfer_percentage([5, 1], [10, 0])
+
+    assert result[0] == 50.0 and np.isnan(result[1])
+
+
+def test_load_cube_files_matches_load_cube(tmp_path):
+    paths = {}
+
+    for name, tree in [("storage", STORAGE), ("mongo", MONGO), ("unique", UNIQUE)]:
+        paths[name] = str(tmp_path / f"{name}.json")
+
+        with open(paths[name], "w") as out:
+            json.dump(tree, out)
+
+    from_files = cube_lib.load_cube_files(paths["storage"], paths["mongo"], paths["unique"])
+    from_trees = cube_lib.load_cube(STORAGE, MONGO, UNIQUE)
+
+    assert from_files.collections == from_trees.collections
+    assert (from_files.counts == from_trees.counts).all()
+    assert (from_files.present == from_trees.present).all()
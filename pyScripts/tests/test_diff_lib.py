@@ -0,0 +1,54 @@
+import json
+import pytest
+from modules import diff_lib, stream_lib
+
+STORAGE = {"2016": {"01": {"01": ["A3", "A1", "A2"], "02": ["B1"]}},
+           "2017": {"03": {"04": ["C1", "C2"]}}}
+MONGO = {"2016": {"01": {"01": ["A2", "A4", "A2"], "03": ["D1"]}},
+         "2017": {"03": {"04": ["C2", "C1"]}}}
+
+
+def write(tmp_path, tree, name):
+    path = tmp_path / name
+    path.write_text(json.dumps(tree))
+    return str(path)
+
+
+def test_sorted_unique():
+    assert list(diff_lib.sorted_unique(["b", "a", "b", "c", "a"])) == ["a", "b", "c"]
+    assert list(diff_lib.sorted_unique([])) == []
+
+
+def test_merge_diff():
+    assert list(diff_lib.merge_diff(["3", "1", "2"], ["2", "4", "2"])) == [("left", "1"), ("left", "3"), ("right", "4")]
+    assert list(diff_lib.merge_diff([], ["1"])) == [("right", "1")]
+
+
+def test_merge_days_aligns_missing_days():
+    storage = iter(stream_lib.walk_tree(STORAGE, 3))
+    mongo = iter(stream_lib.walk_tree(MONGO, 3))
+
+    dates = [day[:3] + (bool(day[3]), bool(day[4])) for day in diff_lib.merge_days(storage, mongo)]
+
+    assert dates == [("2016", "01", "01", True, True), ("2016", "01", "02", True, False),
+                     ("2016", "01", "03", False, True), ("2017", "03", "04", True, True)]
+
+
+def test_merge_days_rejects_unsorted_days():
+    storage = iter([("2016", "01", "02", []), ("2016", "01", "01", [])])
+
+    with pytest.raises(ValueError):
+        list(diff_lib.merge_days(storage, iter([])))
+
+
+def test_diff_trees(tmp_path):
+    missing = tmp_path / "missing.csv"
+    orphaned = tmp_path / "orphaned.csv"
+
+    result = diff_lib.diff_trees(write(tmp_path, STORAGE, "storage.json"), write(tmp_path, MONGO, "mongo.json"),
+                                 str(missing), str(orphaned), "PACS", workers=2)
+
+    assert result == {"2016": (3, 2), "2017": (0, 0)}
+    assert missing.read_text().splitlines() == ["PACS/2016/01/01/A1", "PACS/2016/01/01/A3", "PACS/2016/01/02/B1"]
+    assert orphaned.read_text().splitlines() == ["PACS/2016/01/01/A4", "PACS/2016/01/03/D1"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["missing.csv", "mongo.json", "orphaned.csv", "storage.json"]
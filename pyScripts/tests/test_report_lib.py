@@ -0,0 +1,72 @@
+from datetime import datetime
+import pytest
+
+pytest.importorskip("numpy")
+
+from modules import cube_lib, report_lib
+
+NOW = datetime(2020, 1, 16, 9, 5, 3)
+STORAGE = {"2016": {"01": {"01": 10, "02": 0}}}
+MONGO = {"image_CT": {"2016": {"01": {"01": [4, 3], "03": [1, 1]}}},
+         "image_MR": {"2016": {"01": {"02": [0, 2]}}}}
+
+
+def make_table():
+    table = report_lib.Table("Monthly Counts", ["Year", "Month", "Count"], group=1)
+    table.add_row(2016, "01", 1)
+    table.add_row(2016, "02", "a|b")
+    table.add_row(2017, "01", 3)
+    return table
+
+
+def test_grouped_rows_blank_repeats():
+    assert list(make_table().grouped_rows()) == [["2016", "01", "1"], ["", "02", "a|b"], ["2017", "01", "3"]]
+
+
+def test_markdown():
+    report = report_lib.Report("Title", now=NOW)
+    report.add_table(make_table())
+
+    assert report.markdown().splitlines() == [
+        "# Title",
+        "### Performed on: 2020/1/16 at 9:5:3",
+        "",
+        "## Monthly Counts",
+        "| Year | Month | Count |",
+        "| ---- | ----- | ----- |",
+        "| 2016 | 01 | 1 |",
+        "| | 02 | a\\|b |",
+        "| 2017 | 01 | 3 |"
+    ]
+
+
+def test_write_formats(tmp_path):
+    report = report_lib.Report("Title", now=NOW)
+    report.add_table(make_table())
+    report.add_table(report_lib.Table("Other", ["A"]))
+
+    paths = report.write_all(str(tmp_path / "report.md"), ["md", "csv", "html"])
+
+    assert sorted(paths) == sorted(str(tmp_path / name) for name in
+                                   ["report.md", "report-monthly_counts.csv", "report-other.csv", "report.html"])
+    assert (tmp_path / "report-monthly_counts.csv").read_text() == "Year,Month,Count\n2016,01,1\n2016,02,a|b\n2017,01,3\n"
+    assert "<td>a|b</td>" in (tmp_path / "report.html").read_text()
+    assert not list(tmp_path.glob("*.tmp"))
+
+    with pytest.raises(ValueError):
+        report.write(str(tmp_path / "report.txt"))
+
+
+def test_general_report():
+    report = report_lib.general_report(cube_lib.load_cube(STORAGE, MONGO), now=NOW)
+    monthly, by_path, by_study, collections = report.tables
+
+    assert monthly.rows[0] == ["2016", "01", "10", "4", "5"]  # 2016-01-03 is not a storage day
+    assert by_path.rows == [["2016", "10", "4", "40.0000000%"]]
+    assert collections.rows == [["image_CT", "2016", "5", "4"], ["image_MR", "2016", "0", "2"]]
+
+
+def test_detailed_report():
+    report = report_lib.detailed_report(cube_lib.load_cube(STORAGE, MONGO), now=NOW)
+
+    assert report.tables[0].rows == [["2016", "01", "01", "10", "4", "3"], ["2016", "01", "02", "0", "0", "2"]]
@@ -0,0 +1,98 @@
+import random
+import pytest
+from modules.sketch_lib import HyperLogLog, SpaceSaving
+
+
+def test_hyperloglog_estimate():
+    sketch = HyperLogLog(12)
+
+    for n in range(20000):
+        sketch.add(f"1.2.826.0.1.{n}")
+        sketch.add(f"1.2.826.0.1.{n}")  # Repeats are not counted again
+
+    assert abs(sketch.count() - 20000) < 20000 * 0.05
+
+
+def test_hyperloglog_small_sets_are_exact():
+    sketch = HyperLogLog(12)
+
+    for n in range(50):
+        sketch.add(n)
+
+    assert sketch.count() == 50
+
+
+def test_hyperloglog_merge_counts_the_union():
+    left = HyperLogLog(10)
+    right = HyperLogLog(10)
+    union = HyperLogLog(10)
+
+    for n in range(3000):
+        left.add(n)
+        union.add(n)
+
+    for n in range(2000, 5000):
+        right.add(n)
+        union.add(n)
+
+    assert left.merge(right).registers == union.registers
+
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(11))
+
+
+def test_hyperloglog_json_round_trip():
+    sketch = HyperLogLog(8)
+
+    for n in range(100):
+        sketch.add(n)
+
+    copy = HyperLogLog.from_json(sketch.to_json())
+
+    assert copy.precision == 8 and copy.registers == sketch.registers
+
+
+def test_hyperloglog_add_hash():
+    random.seed(1)
+    precision = 12
+    smallest = {}
+
+    for _ in range(10000):  # Signed 64-bit hashes, bucketed as the server does
+        value = random.getrandbits(64) - (1 << 63)
+        index = value & ((1 << precision) - 1)
+        smallest[index] = min(smallest.get(index, value & ((1 << 63) - 1)), value & ((1 << 63) - 1))
+
+    sketch = HyperLogLog(precision)
+
+    for index, rest in smallest.items():
+        sketch.add_hash(index, rest)
+
+    assert abs(sketch.count() - 10000) < 10000 * 0.05
+
+
+def test_space_saving_keeps_heavy_hitters():
+    random.seed(2)
+    stream = ["MR"] * 400 + ["CT"] * 300 + [f"rare{n}" for n in range(300)]
+    random.shuffle(stream)
+    sketch = SpaceSaving(k=5)
+
+    for item in stream:
+        sketch.add(item)
+
+    top = sketch.top(2)
+
+    assert list(top) == ["MR", "CT"]
+
+    for item, count in top.items():
+        assert count - sketch.errors[item] <= stream.count(item) <= count
+
+
+def test_space_saving_weights_and_merge():
+    left = SpaceSaving(k=3)
+    right = SpaceSaving(k=3)
+    left.add("a", 10)
+    left.add("b", 5)
+    right.add("a", 2)
+    right.add("c", 7)
+
+    assert left.merge(right).top() == {"a": 12, "c": 7, "b": 5}
@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modules import cube_lib, snapshot_lib
+
+STORAGE = {"2016": {"01": {"01": 10}}}
+BEFORE = {"image_CT": {"2016": {"01": {"01": [4, 3], "02": [2, 2]}}}}
+AFTER = {"image_CT": {"2016": {"01": {"01": [3, 3]}}, "2017": {"01": {"01": [1, 1]}}},
+         "image_MR": {"2016": {"01": {"02": [5, 5]}}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = snapshot_lib.SnapshotStore(str(tmp_path / "snapshots"))
+    store.save(cube_lib.load_cube(STORAGE, BEFORE), run="before", label="before-dedup")
+    store.save(cube_lib.load_cube(STORAGE, AFTER), run="after", label="after-dedup")
+    return store
+
+
+def test_catalog(store):
+    reopened = snapshot_lib.SnapshotStore(store.directory)
+
+    assert [entry["run"] for entry in reopened.runs()] == ["before", "after"]
+    assert [entry["run"] for entry in reopened.runs("after-dedup")] == ["after"]
+
+    with pytest.raises(ValueError):
+        store.save(cube_lib.load_cube(STORAGE, BEFORE), run="before")
+
+    with pytest.raises(KeyError):
+        store.open("missing")
+
+
+def test_snapshot_series(store):
+    snapshot = store.open("after")
+
+    assert snapshot.rows() == [1, 2]
+    assert snapshot.rows(["image_MR", "image_PT"]) == [2]
+    assert snapshot.series("path", np.datetime64("2015-12-31"), np.datetime64("2016-01-04")).tolist() == [0, 3, 5, 0]
+
+
+def test_delta(store):
+    dates, delta = store.delta("before", "after", "path", end="2016-01-03")
+
+    assert dates.astype(str).tolist() == ["2016-01-01", "2016-01-02"]
+    assert delta.tolist() == [-1, 3]
+
+
+def test_trend(store):
+    runs, labels, totals = store.trend("path")
+
+    assert runs == ["before", "after"]
+    assert labels == ["2016", "2017"]
+    assert totals.tolist() == [[6, 0], [8, 1]]
+
+    runs, labels, totals = store.trend("path", collections=["image_MR"], period="month", label="after-dedup")
+
+    assert runs == ["after"] and totals[0][labels.index("2016-01")] == 5
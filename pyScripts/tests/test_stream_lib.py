@@ -0,0 +1,79 @@
+import json
+import pytest
+from modules import stream_lib
+
+BACKENDS = ["stream"] + (["ijson"] if stream_lib.ijson is not None else [])
+
+STORAGE = {"2016": {"01": {"01": 1.5, "02": 2e+20, "03": -3.25e-2, "04": 7, "05": 0.0}},
+           "2017": {"12": {"31": 12345}}}
+MONGO = {"image_CT": {"2016": {"01": {"01": [1, 2], "02": [3.5, 4e-3]}}},
+         "image_MR": {"2016": {"02": {"29": [0, 12]}}}}
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    if request.param == "stream":
+        monkeypatch.setattr(stream_lib, "ijson", None)
+
+    return request.param
+
+
+def write(tmp_path, tree, name="counts.json"):
+    path = tmp_path / name
+    path.write_text(json.dumps(tree))
+    return str(path)
+
+
+def test_numbers_split_at_every_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(stream_lib, "ijson", None)
+    path = write(tmp_path, STORAGE)
+    expected = list(stream_lib.walk_tree(STORAGE, 3))
+
+    for chunk_size in range(1, len(json.dumps(STORAGE)) + 2):
+        assert list(stream_lib.iter_records(path, 3, chunk_size=chunk_size)) == expected
+
+
+def test_nested_records_split_at_every_offset(tmp_path, monkeypatch):
+    monkeypatch.setattr(stream_lib, "ijson", None)
+    path = write(tmp_path, MONGO)
+    expected = list(stream_lib.walk_tree(MONGO, 4))
+
+    for chunk_size in range(1, len(json.dumps(MONGO)) + 2):
+        assert list(stream_lib.iter_records(path, 4, chunk_size=chunk_size)) == expected
+
+
+def test_keys_filter(tmp_path, backend):
+    path = write(tmp_path, STORAGE)
+
+    assert list(stream_lib.iter_days(path, ["2017"])) == [("2017", "12", "31", 12345)]
+
+
+def test_failed_collection_is_skipped(tmp_path, backend, capsys):
+    tree = {"image_CT": False, "image_MR": MONGO["image_MR"], "image_PT": {"2016": None}}
+    path = write(tmp_path, tree)
+
+    assert list(stream_lib.iter_records(path, 4)) == [("image_MR", "2016", "02", "29", [0, 12])]
+    assert "Skipping image_CT" in capsys.readouterr().out
+
+
+def test_skip_strings_with_brackets(tmp_path, monkeypatch):
+    monkeypatch.setattr(stream_lib, "ijson", None)
+    tree = {"a": {"x": "}{[\"]", "y": [{"z": "]"}]}, "b": {"c": 1}}
+    path = write(tmp_path, tree)
+
+    for chunk_size in range(1, len(json.dumps(tree)) + 2):
+        assert list(stream_lib.iter_records(path, 2, ["b"], chunk_size=chunk_size)) == [("b", "c", 1)]
+
+
+def test_list_years_and_load(tmp_path):
+    path = write(tmp_path, STORAGE)
+
+    assert stream_lib.list_years(path, chunk_size=3) == ["2016", "2017"]
+    assert stream_lib.load(path) == STORAGE
+
+
+def test_keys_stop_reading_once_found(tmp_path, backend):
+    path = tmp_path / "counts.json"
+    path.write_text(json.dumps(STORAGE)[:-1] + ', "2018": {"01": {"01": ')  # Truncated after the requested year
+
+    assert list(stream_lib.iter_days(str(path), ["2016"])) == list(stream_lib.walk_tree({"2016": STORAGE["2016"]}, 3))